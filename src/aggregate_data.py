@@ -1,50 +1,69 @@
+import argparse
 from datetime import datetime
 import numpy as np
 
 import params as par
-from util import csvutil, dataio, paramutil, timeutil
+from util import daily_frame, dataio, paramutil, timeutil
+from util import manifest as mfs
 
-def aggregate_data_by_period(daily_data_dict, period):
+def aggregate_data_by_period(daily_data, period):
   start_time = datetime.now()
 
-  periodly_data_dict = {}
-  for d in daily_data_dict:
-    period_start_date = timeutil.CalendarUtil.get_period_start_date(d, period)
-    if period_start_date not in periodly_data_dict:
-      periodly_data_dict[period_start_date] = {}
-    for r in daily_data_dict[d]:
-      if r.name not in periodly_data_dict[period_start_date]:
-        periodly_data_dict[period_start_date][r.name] = []
-      periodly_data_dict[period_start_date][r.name].append(daily_data_dict[d][r])
-
-  for p in periodly_data_dict:
-    for r in periodly_data_dict[p]:
-      periodly_avg = np.average(periodly_data_dict[p][r])
-      periodly_data_dict[p][r] = round(periodly_avg, 2)
+  # Dates are sorted, so the dates of each period are contiguous.
+  period_start_dates = np.array([timeutil.CalendarUtil.get_period_start_date(d, period) \
+                                    for d in daily_data.get_dates()], dtype = 'datetime64[D]')
+  periods, period_starts = np.unique(period_start_dates, return_index = True)
+  period_ends = list(period_starts[1 : ]) + [len(daily_data)]
+
+  values = np.full((len(periods), len(daily_data.activities)), np.nan, dtype = np.float64,
+                    order = 'F')
+  for j, r in enumerate(daily_data.activities):
+    daily_values = daily_data.get_column(r)
+    daily_valid = daily_data.get_valid(r)
+    for p, (start, end) in enumerate(zip(period_starts, period_ends)):
+      period_values = daily_values[start : end][daily_valid[start : end]]
+      if len(period_values):
+        values[p, j] = np.average(period_values)
+  values = np.round(values, 2)
   
   print()
   print("{} aggregate built in {}".format(period.name.capitalize(), datetime.now() - start_time))
   
-  return periodly_data_dict
+  return daily_frame.DailyFrame(periods, daily_data.activities, values, ~np.isnan(values))
 
 
-def aggregate_data():
+def aggregate_data(force = False):
   paramutil.Validator.validate_aggregate_data()
 
   start_time = datetime.now()
   
   dio = dataio.DataIO(par.DataParams)
   in_csv = dio.get_csv_file()
-  daily_data_dict = csvutil.CsvIO.read_data_csv(in_csv)
+  manifest = mfs.OutputManifest(dio.get_manifest_file())
+  input_hashes = {'daily data': mfs.OutputManifest.get_file_content_hash(in_csv),
+                  'params': mfs.OutputManifest.get_params_hash([par.DataParams]),
+                  'code': mfs.OutputManifest.get_code_hash(__file__)}
 
+  # Daily data is only read if some aggregate must be built.
+  daily_data = None
   for period in par.AggregatorParams.AGGREGATION_PERIODS:
-    aggregated_data_dict = aggregate_data_by_period(daily_data_dict, period)
+    aggregated_csv = dio.get_csv_file(period = period)
+    if par.AggregatorParams.WRITE_DATA \
+        and manifest.check(aggregated_csv, input_hashes, force = force):
+      continue
+
+    if daily_data is None:
+      daily_data = dio.read_data(in_csv)
+    aggregated_frame = aggregate_data_by_period(daily_data, period)
     if par.AggregatorParams.WRITE_DATA:
-      aggregated_csv = dio.get_csv_file(period = period)
-      csvutil.CsvIO.write_data_csv(aggregated_csv, aggregated_data_dict)
+      dio.write_frame(aggregated_csv, aggregated_frame)
+      manifest.record(aggregated_csv, input_hashes)
     
   print()
   print("Aggregation done in {}".format(datetime.now() - start_time))
 
 if __name__ == '__main__':
-  aggregate_data()
\ No newline at end of file
+  arg_parser = argparse.ArgumentParser()
+  arg_parser.add_argument('--force', action = 'store_true',
+                          help = "Aggregate even if output files are current")
+  aggregate_data(force = arg_parser.parse_args().force)
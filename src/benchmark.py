@@ -0,0 +1,358 @@
+from contextlib import redirect_stdout
+from datetime import date, datetime, timedelta, timezone
+import io
+import numpy as np
+from pathlib import Path
+import random
+import tempfile
+import timeit
+import tracemalloc
+
+import params as par
+from util import aggregation, csvutil, daily_frame, paramutil, timeutil, valueutil, xml_parse, \
+                  xml_stream
+
+def show_benchmark_results(title, num_items, timings):
+  print()
+  print(title.upper())
+  for name, seconds in timings.items():
+    print("\t{name:<24}{total:8.3f} s\t{per_item:10.1f} ns/item".format(
+              name = name,
+              total = seconds,
+              per_item = seconds / num_items * 1e9))
+
+
+def build_sample_values(num_values):
+  record_units = paramutil.RecordProperties.get_record_units()
+  record_types = list(record_units.keys())
+
+  sample_values = []
+  for _ in range(num_values):
+    r = random.choice(record_types)
+    if record_units[r] in ['count', 'min']:
+      sample_values.append(tuple([r, str(random.randint(0, 200))]))
+    else:
+      sample_values.append(tuple([r, "{:.3f}".format(random.uniform(0, 200))]))
+  return sample_values
+
+def benchmark_value_decoding(num_values, num_runs):
+  sample_values = build_sample_values(num_values)
+
+  def decode_with_eval():
+    for _, v in sample_values:
+      eval(v)
+
+  def decode_numbers():
+    for _, v in sample_values:
+      valueutil.ValueDecoder.try_decode(v)
+
+  timings = {'eval': min(timeit.repeat(decode_with_eval, number = 1, repeat = num_runs)),
+             'decode_number': min(timeit.repeat(decode_numbers, number = 1, repeat = num_runs))}
+  show_benchmark_results("Value decoding", num_values, timings)
+
+
+def build_sample_timestamps(num_timestamps):
+  utc_offsets = [timedelta(hours = -7), timedelta(hours = 1),
+                  timedelta(hours = 5, minutes = 30), timedelta(hours = 8)]
+  start_time = datetime(2021, 1, 1, tzinfo = timezone.utc)
+
+  sample_timestamps = []
+  for _ in range(num_timestamps):
+    dt = start_time + timedelta(seconds = random.randint(0, 5 * 365 * 24 * 60 * 60))
+    dt = dt.astimezone(timezone(random.choice(utc_offsets)))
+    sample_timestamps.append(dt.strftime('%Y-%m-%d %H:%M:%S %z'))
+  return sample_timestamps
+
+def benchmark_datetime_decoding(num_timestamps, num_runs):
+  sample_timestamps = build_sample_timestamps(num_timestamps)
+  current_timezone = par.ParseTimezone.CURRENT_TIMEZONE
+
+  def decode_with_strptime():
+    for ts in sample_timestamps:
+      datetime.strptime(ts, '%Y-%m-%d %H:%M:%S %z')
+
+  def decode_datetime():
+    for ts in sample_timestamps:
+      timeutil.DatetimeUtil.decode_xml_datetime(ts)
+
+  def decode_epoch():
+    for ts in sample_timestamps:
+      timeutil.DatetimeUtil.parse_xml_timestamp(ts)
+
+  def decode_day_hour():
+    for ts in sample_timestamps:
+      timeutil.DatetimeUtil.parse_xml_day_hour(ts, current_timezone)
+
+  timings = {'strptime': min(timeit.repeat(decode_with_strptime, number = 1, repeat = num_runs)),
+             'datetime': min(timeit.repeat(decode_datetime, number = 1, repeat = num_runs)),
+             'epoch seconds': min(timeit.repeat(decode_epoch, number = 1, repeat = num_runs)),
+             'day and hour': min(timeit.repeat(decode_day_hour, number = 1, repeat = num_runs))}
+  show_benchmark_results("Datetime decoding", num_timestamps, timings)
+
+
+def benchmark_timezone_lookup(num_timestamps, num_runs):
+  sample_timestamps = build_sample_timestamps(num_timestamps)
+  epoch_seconds = [timeutil.DatetimeUtil.parse_xml_timestamp(ts)[0] for ts in sample_timestamps]
+  epoch_seconds_array = np.array(epoch_seconds)
+
+  def lookup_bisect():
+    for es in epoch_seconds:
+      timeutil.TimezoneUtil.get_utc_offset(es)
+
+  def lookup_vectorized():
+    timeutil.TimezoneUtil.get_local_days_hours(epoch_seconds_array)
+
+  timings = {'bisect': min(timeit.repeat(lookup_bisect, number = 1, repeat = num_runs)),
+             'vectorized': min(timeit.repeat(lookup_vectorized, number = 1, repeat = num_runs))}
+  show_benchmark_results("Timezone lookup", num_timestamps, timings)
+
+
+def benchmark_aggregation(num_records, num_runs):
+  sample_values = build_sample_values(num_records)
+  # Few enough days that most days have values in every hour
+  first_day = date(2025, 1, 1).toordinal()
+  num_days = max(1, num_records // 1000)
+
+  records = []
+  day_ordinals = []
+  hours = []
+  values = []
+  for r, v in sample_values:
+    records.append(r)
+    day_ordinals.append(first_day + random.randrange(num_days))
+    hours.append(random.randrange(24))
+    values.append(valueutil.ValueDecoder.decode_number(v))
+  record_columns = tuple([np.array([r.value for r in records]),
+                          np.array(day_ordinals),
+                          np.array(hours),
+                          np.array(values, dtype = float),
+                          np.array([isinstance(v, int) for v in values])])
+
+  def aggregate_dicts():
+    records_by_date = {rt.record: {} for rt in par.RecordParams.RECORD_TYPES}
+    for r, d, hr, v in zip(records, day_ordinals, hours, values):
+      if d not in records_by_date[r]:
+        records_by_date[r][d] = {}
+      xml_parse.XmlParse.add_to_hour(records_by_date[r][d], hr, v)
+    return xml_parse.XmlParse.aggregate_xml_records(records_by_date)
+
+  def aggregate_columns():
+    return aggregation.ColumnAggregation.aggregate_columns(*record_columns)
+
+  dict_records_by_date = aggregate_dicts()
+  column_records_by_date = aggregate_columns()
+  # Compared by repr, so that NumPy types must match as well as values
+  results_match = all(
+      {date.fromordinal(d): repr(v) for d, v in dict_records_by_date[r].items()} \
+          == {d: repr(v) for d, v in column_records_by_date[r].items()} \
+      for r in dict_records_by_date)
+
+  timings = {'nested dicts': min(timeit.repeat(aggregate_dicts, number = 1, repeat = num_runs)),
+             'columns': min(timeit.repeat(aggregate_columns, number = 1, repeat = num_runs))}
+  show_benchmark_results("Hour and day aggregation", num_records, timings)
+  print("\tResults match: {}".format(results_match))
+
+
+def write_sample_export(out_xml, num_records, num_other_records = None, by_type = False,
+                        num_workouts = 0):
+  # Records of other types, which are not parsed, are spread between records (one for every 2nd
+  #   record by default), or grouped by type, as Apple Health exports them. Workouts are written
+  #   after all records, as at the end of an export.
+  record_units = paramutil.RecordProperties.get_record_units()
+  sample_values = build_sample_values(num_records)
+  sample_timestamps = build_sample_timestamps(num_records)
+  if num_other_records is None:
+    num_other_records = (num_records + 1) // 2
+
+  elements = []
+  for i, ((r, v), ts) in enumerate(zip(sample_values, sample_timestamps)):
+    record = ' <Record type="HKQuantityTypeIdentifier{r}" sourceName="Watch" unit="{u}" ' \
+                'creationDate="{ts}" startDate="{ts}" endDate="{ts}" value="{v}"' \
+                .format(r = r.name, u = record_units[r], ts = ts, v = v)
+    if i % 10 == 0:
+      # Records with children, and records nested in a Correlation, as in real exports
+      elements.append(tuple([r.name, record + '>\n  <MetadataEntry key="HKWasUserEntered" '
+                                        'value="0"/>\n </Record>\n']))
+      elements.append(tuple(['Correlation',
+                              ' <Correlation type="HKCorrelationTypeIdentifierFood">\n '
+                                  + record + '/>\n </Correlation>\n']))
+    else:
+      elements.append(tuple([r.name, record + '/>\n']))
+    for _ in range((i + 1) * num_other_records // num_records \
+                      - i * num_other_records // num_records):
+      elements.append(tuple(['SleepAnalysis',
+                              ' <Record type="HKCategoryTypeIdentifierSleepAnalysis" '
+                              'sourceName="Watch" startDate="{ts}" endDate="{ts}" '
+                              'value="HKCategoryValueSleepAnalysisAsleep"/>\n'.format(ts = ts)]))
+  if by_type:
+    elements.sort(key = lambda e: e[0])
+
+  with open(out_xml, 'w') as xml_file:
+    xml_file.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+    xml_file.write('<HealthData locale="en_US">\n')
+    xml_file.write(' <ExportDate value="2026-01-06 09:00:00 -0800"/>\n')
+    for _, element in elements:
+      xml_file.write(element)
+    for _ in range(num_workouts):
+      xml_file.write(' <Workout workoutActivityType="HKWorkoutActivityTypeWalking" '
+                      'duration="30" durationUnit="min" sourceName="Watch" '
+                      'startDate="2025-01-01 09:00:00 -0800" endDate="2025-01-01 09:30:00 -0800">\n'
+                      '  <WorkoutEvent type="HKWorkoutEventTypeSegment" '
+                      'date="2025-01-01 09:00:00 -0800"/>\n </Workout>\n')
+    xml_file.write('</HealthData>\n')
+
+def benchmark_xml_backends(num_records, num_runs):
+  backends = [par.XmlBackend.ELEMENT_TREE, par.XmlBackend.EXPAT]
+  if xml_stream.lxml_etree:
+    backends.append(par.XmlBackend.LXML)
+
+  with tempfile.TemporaryDirectory() as tmp_dir:
+    sample_xml = Path(tmp_dir) / 'export.xml'
+    write_sample_export(sample_xml, num_records)
+
+    def read_records(backend):
+      return [dict(attrib) \
+                  for attrib in xml_stream.XmlStream(sample_xml, backend = backend).iter_records()]
+
+    records_by_backend = {b: read_records(b) for b in backends}
+    results_match = all(records_by_backend[b] == records_by_backend[backends[0]] \
+                            for b in backends)
+
+    timings = {}
+    for b in backends:
+      timings[b.name] = min(timeit.repeat(lambda: read_records(b), number = 1, repeat = num_runs))
+    show_benchmark_results("XML backends", num_records, timings)
+    print("\tResults match: {}".format(results_match))
+
+def benchmark_prefilter(num_records, num_runs):
+  record_types = {'HKQuantityTypeIdentifier' + rt.record.name \
+                      for rt in par.RecordParams.RECORD_TYPES}
+  # The prefilter only pays off when most of the export is records of other types.
+  num_kept_records = num_records // 5
+
+  with tempfile.TemporaryDirectory() as tmp_dir:
+    sample_xmls = {'mixed': Path(tmp_dir) / 'export.xml',
+                    '80% other': Path(tmp_dir) / 'export_by_type.xml'}
+    write_sample_export(sample_xmls['mixed'], num_records)
+    write_sample_export(sample_xmls['80% other'], num_kept_records,
+                        num_other_records = num_records - num_kept_records, by_type = True)
+
+    def read_records(sample_xml, prefilter_records):
+      records = xml_stream.XmlStream(sample_xml, prefilter_records = prefilter_records) \
+                    .iter_records()
+      return [dict(attrib) for attrib in records if attrib['type'] in record_types]
+
+    results_match = all(read_records(x, False) == read_records(x, True) \
+                            for x in sample_xmls.values())
+
+    timings = {}
+    for name, sample_xml in sample_xmls.items():
+      timings[name + ', full'] = min(timeit.repeat(lambda: read_records(sample_xml, False),
+                                                   number = 1, repeat = num_runs))
+      timings[name + ', prefiltered'] = min(timeit.repeat(lambda: read_records(sample_xml, True),
+                                                          number = 1, repeat = num_runs))
+    show_benchmark_results("Record prefilter", num_records, timings)
+    print("\tResults match: {}".format(results_match))
+
+def benchmark_aligned_chunks(num_records, num_runs):
+  # Chunks aligned to records (for checkpoints) should cost no more than chunks as read, even
+  #   with a long tail of Workouts without any records.
+  with tempfile.TemporaryDirectory() as tmp_dir:
+    sample_xml = Path(tmp_dir) / 'export.xml'
+    write_sample_export(sample_xml, num_records, num_workouts = num_records)
+
+    def read_chunks(align_chunks):
+      return [len(chunk) \
+                  for chunk in xml_stream.XmlStream(sample_xml, align_chunks = align_chunks) \
+                                    .iter_chunks()]
+
+    def read_records(align_chunks):
+      return [dict(attrib) \
+                  for attrib in xml_stream.XmlStream(sample_xml, align_chunks = align_chunks) \
+                                    .iter_records()]
+
+    results_match = read_records(False) == read_records(True)
+
+    timings = {'as read': min(timeit.repeat(lambda: read_chunks(False),
+                                            number = 1, repeat = num_runs)),
+               'aligned': min(timeit.repeat(lambda: read_chunks(True),
+                                            number = 1, repeat = num_runs))}
+    show_benchmark_results("Chunks aligned to records", num_records, timings)
+    for name, align_chunks in [('as read', False), ('aligned', True)]:
+      print("\t{name:<24}{mb:8.1f} MB largest chunk".format(
+                name = name, mb = max(read_chunks(align_chunks)) / (1 << 20)))
+    print("\tResults match: {}".format(results_match))
+
+def write_sample_csv(out_csv, num_values):
+  # One row per day, with about a tenth of values missing
+  record_units = paramutil.RecordProperties.get_record_units()
+  record_types = list(record_units.keys())
+  num_days = max(1, num_values // len(record_types))
+  first_day = date(2000, 1, 1)
+
+  data_dict = {}
+  for i in range(num_days):
+    day_values = {}
+    for r in record_types:
+      if random.random() < 0.1:
+        continue
+      if record_units[r] in ['count', 'min']:
+        day_values[r.name] = random.randint(0, 20000)
+      else:
+        day_values[r.name] = round(random.uniform(0, 200), 2)
+    data_dict[first_day + timedelta(days = i)] = day_values
+
+  with redirect_stdout(io.StringIO()):
+    csvutil.CsvIO.write_data_csv(out_csv, data_dict)
+
+def benchmark_csv_loading(num_values, num_runs):
+  with tempfile.TemporaryDirectory() as tmp_dir:
+    sample_csv = Path(tmp_dir) / 'data.csv'
+    write_sample_csv(sample_csv, num_values)
+
+    def read_dicts():
+      return daily_frame.DailyFrame.from_data_dict(csvutil.CsvIO.read_data_csv(sample_csv))
+
+    def read_columns():
+      return csvutil.CsvIO.read_data_frame(sample_csv)
+
+    def get_peak_memory(read_csv):
+      tracemalloc.start()
+      read_csv()
+      _, peak_bytes = tracemalloc.get_traced_memory()
+      tracemalloc.stop()
+      return peak_bytes
+
+    # Readers print their timing, which is not shown here.
+    with redirect_stdout(io.StringIO()):
+      dict_frame = read_dicts()
+      column_frame = read_columns()
+      results_match = np.array_equal(dict_frame.dates, column_frame.dates) \
+                        and dict_frame.activities == column_frame.activities \
+                        and np.array_equal(dict_frame.values, column_frame.values, equal_nan = True)
+
+      timings = {'DictReader': min(timeit.repeat(read_dicts, number = 1, repeat = num_runs)),
+                 'columns': min(timeit.repeat(read_columns, number = 1, repeat = num_runs))}
+      peak_memory = {'DictReader': get_peak_memory(read_dicts),
+                     'columns': get_peak_memory(read_columns)}
+
+    show_benchmark_results("CSV loading", num_values, timings)
+    for name, peak_bytes in peak_memory.items():
+      print("\t{name:<24}{mb:8.1f} MB peak".format(name = name, mb = peak_bytes / (1 << 20)))
+    print("\tResults match: {}".format(results_match))
+
+
+def benchmark():
+  paramutil.Validator.validate_benchmark()
+
+  benchmark_value_decoding(par.BenchmarkParams.NUM_RECORDS, par.BenchmarkParams.NUM_RUNS)
+  benchmark_datetime_decoding(par.BenchmarkParams.NUM_RECORDS, par.BenchmarkParams.NUM_RUNS)
+  benchmark_timezone_lookup(par.BenchmarkParams.NUM_RECORDS, par.BenchmarkParams.NUM_RUNS)
+  benchmark_aggregation(par.BenchmarkParams.NUM_RECORDS, par.BenchmarkParams.NUM_RUNS)
+  benchmark_xml_backends(par.BenchmarkParams.NUM_RECORDS, par.BenchmarkParams.NUM_RUNS)
+  benchmark_prefilter(par.BenchmarkParams.NUM_RECORDS, par.BenchmarkParams.NUM_RUNS)
+  benchmark_aligned_chunks(par.BenchmarkParams.NUM_RECORDS, par.BenchmarkParams.NUM_RUNS)
+  benchmark_csv_loading(par.BenchmarkParams.NUM_RECORDS, par.BenchmarkParams.NUM_RUNS)
+
+if __name__ == '__main__':
+  benchmark()
@@ -16,7 +16,7 @@ def bucket_randomly(r_values, num_buckets):
 
   return sorted(subset_averages)
 
-def build_bucket_tuning_graphs(data_dict, record_aggregation_types, record_units,
+def build_bucket_tuning_graphs(frame, record_aggregation_types, record_units,
                                 bucket_range, num_runs, zoom_graph):
   assert not record_aggregation_types.keys() ^ record_units.keys()
 
@@ -24,7 +24,7 @@ def build_bucket_tuning_graphs(data_dict, record_aggregation_types, record_units
     if not record_aggregation_types[r] == par.AggregateType.SUM:
       continue
 
-    r_by_date = csvutil.CsvData.build_time_series_for_record(r, data_dict, record_units[r])
+    r_by_date = csvutil.CsvData.build_time_series_for_record(r, frame, record_units[r])
 
     datasets = {}
     for num_buckets in bucket_range:
@@ -55,12 +55,12 @@ def bucket_tuning():
 
   dio = dataio.DataIO(par.DataParams)
   data_csv = dio.get_csv_file()
-  data_dict = csvutil.CsvIO.read_data_csv(data_csv)
+  frame = dio.read_data(data_csv)
 
   bucket_range = list(range(par.BucketTuningParams.MIN_BUCKETS,
                             par.BucketTuningParams.MAX_BUCKETS + 1,
                             par.BucketTuningParams.BUCKET_STEP))
-  build_bucket_tuning_graphs(data_dict, record_aggregation_types, record_units,
+  build_bucket_tuning_graphs(frame, record_aggregation_types, record_units,
                               bucket_range, par.BucketTuningParams.NUM_RUNS,
                               par.BucketTuningParams.ZOOM_GRAPH)
 
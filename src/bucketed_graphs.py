@@ -29,13 +29,13 @@ def bucket_randomly(r_by_date, num_buckets):
 
   return datasets
 
-def build_period_bucket_graphs(data_dict, record_aggregation_types, record_units,
+def build_period_bucket_graphs(frame, record_aggregation_types, record_units,
                                 start_date, end_date, period, bucketing):
   assert not record_aggregation_types.keys() ^ record_units.keys()
 
   print()
   for r in record_aggregation_types:
-    r_by_date = csvutil.CsvData.build_time_series_for_record(r, data_dict, record_units[r],
+    r_by_date = csvutil.CsvData.build_time_series_for_record(r, frame, record_units[r],
                                                                 start_date, end_date)
 
     if bucketing == par.BucketingType.BY_YEAR:
@@ -69,9 +69,9 @@ def bucketed_graphs():
   dio = dataio.DataIO(par.DataParams)
   for period in par.BucketedGraphParams.AGGREGATION_PERIODS:
     data_csv = dio.get_csv_file(period = period)
-    data_dict = csvutil.CsvIO.read_data_csv(data_csv)
+    frame = dio.read_data(data_csv)
     
-    build_period_bucket_graphs(data_dict, record_aggregation_types, record_units,
+    build_period_bucket_graphs(frame, record_aggregation_types, record_units,
                                 start_date = par.BucketedGraphParams.GRAPH_START_DATE,
                                 end_date = par.BucketedGraphParams.GRAPH_END_DATE,
                                 period = period, bucketing = par.BucketedGraphParams.BUCKETING)
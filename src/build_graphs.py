@@ -2,7 +2,7 @@ import params as par
 from graph import histogram, linegraph
 from util import csvutil, dataio, paramutil, timeutil
 
-def build_period_histograms(data_dict, record_aggregation_types, record_units,
+def build_period_histograms(frame, record_aggregation_types, record_units,
                             start_date, end_date, period):
   assert not record_aggregation_types.keys() ^ record_units.keys()
 
@@ -11,8 +11,8 @@ def build_period_histograms(data_dict, record_aggregation_types, record_units,
     if not record_aggregation_types[r] == par.AggregateType.SUM:
       continue
 
-    r_by_date = csvutil.CsvData.build_time_series_for_record(r, data_dict, record_units[r],
-                                                                start_date, end_date, sort = True)
+    r_by_date = csvutil.CsvData.build_time_series_for_record(r, frame, record_units[r],
+                                                                start_date, end_date)
 
     hist = histogram.SingleSeriesHistogram(
               data = r_by_date,
@@ -27,15 +27,15 @@ def build_period_histograms(data_dict, record_aggregation_types, record_units,
   print()
   print("Created {} histograms.".format(period.name.capitalize()))
     
-def build_line_graphs(data_dicts, record_aggregation_types, record_units, start_date, end_date):
+def build_line_graphs(frames, record_aggregation_types, record_units, start_date, end_date):
   assert not record_aggregation_types.keys() ^ record_units.keys()
 
   print()
   for r in record_aggregation_types:
     period_datasets = {}
-    for period, data_dict in data_dicts.items():
-      r_by_date = csvutil.CsvData.build_time_series_for_record(r, data_dict, record_units[r],
-                                                                start_date, end_date, sort = True)
+    for period, frame in frames.items():
+      r_by_date = csvutil.CsvData.build_time_series_for_record(r, frame, record_units[r],
+                                                                start_date, end_date)
       period_datasets[period] = r_by_date
 
     if par.GraphParams.LINE_GRAPHS:
@@ -63,20 +63,20 @@ def build_graphs():
   if par.GraphParams.HISTOGRAMS:
     for period in par.GraphParams.AGGREGATION_PERIODS:
       data_csv = dio.get_csv_file(period = period)
-      data_dict = csvutil.CsvIO.read_data_csv(data_csv)
+      frame = dio.read_data(data_csv)
 
-      build_period_histograms(data_dict, record_aggregation_types, record_units,
+      build_period_histograms(frame, record_aggregation_types, record_units,
                               start_date = par.GraphParams.GRAPH_START_DATE,
                               end_date = par.GraphParams.GRAPH_END_DATE,
                               period = period)
   
   if par.GraphParams.LINE_GRAPHS:
-    data_dicts = {}
+    frames = {}
     for period in par.GraphParams.AGGREGATION_PERIODS:
       data_csv = dio.get_csv_file(period = period)
-      data_dicts[period] = csvutil.CsvIO.read_data_csv(data_csv)
+      frames[period] = dio.read_data(data_csv)
     
-    build_line_graphs(data_dicts, record_aggregation_types, record_units,
+    build_line_graphs(frames, record_aggregation_types, record_units,
                       start_date = par.GraphParams.GRAPH_START_DATE,
                       end_date = par.GraphParams.GRAPH_END_DATE)
 
@@ -1,7 +1,7 @@
 import params as par
 from util import csvutil, dataio, datautil, paramutil
 
-def fit_distribution(data_dict, record_aggregation_types, record_units, period,
+def fit_distribution(frame, record_aggregation_types, record_units, period,
                       record_types, num_best_fits):
   assert not record_aggregation_types.keys() ^ record_units.keys()
   assert not record_types - record_aggregation_types.keys()
@@ -12,8 +12,7 @@ def fit_distribution(data_dict, record_aggregation_types, record_units, period,
     if not record_aggregation_types[r] == par.AggregateType.SUM:
       continue
 
-    r_by_date = csvutil.CsvData.build_time_series_for_record(r, data_dict, record_units[r],
-                                                              sort = True)
+    r_by_date = csvutil.CsvData.build_time_series_for_record(r, frame, record_units[r])
     fit_results[r] = datautil.DataSeriesMetrics.get_best_fit(list(r_by_date.values()),
                                                               num_best_fits = num_best_fits)
 
@@ -35,9 +34,9 @@ def distribution_fit():
 
   for period in par.DistributionFitParams.AGGREGATION_PERIODS:
     data_csv = dio.get_csv_file(period = period)
-    data_dict = csvutil.CsvIO.read_data_csv(data_csv)
+    frame = dio.read_data(data_csv)
 
-    fit_distribution(data_dict, record_aggregation_types, record_units, period = period,
+    fit_distribution(frame, record_aggregation_types, record_units, period = period,
                       record_types = par.DistributionFitParams.ACTIVITIES,
                       num_best_fits = par.DistributionFitParams.NUM_BEST_FITS)
 
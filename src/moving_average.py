@@ -1,22 +1,17 @@
 import params as par
 from graph import movingavg, rmserror
-from util import csvutil, dataio, paramutil
+from util import dataio, paramutil
 
 import numpy as np
 import math
 
 DAYS_IN_WEEK = 7
 
-def build_moving_averages(data_dict, activities, min_weeks, max_weeks, consistent_periods):
+def build_moving_averages(frame, activities, min_weeks, max_weeks, consistent_periods):
   
-  all_dates = list(data_dict.keys())
-  activity_to_vals = {a: [] for a in activities if all(a in data_dict[d] for d in data_dict)}
-  for d in data_dict:
-    for a in activity_to_vals:
-      activity_to_vals[a].append(data_dict[d][a])
-  
-  for a in activity_to_vals:
-    assert len(activity_to_vals[a]) == len(all_dates)
+  all_dates = frame.get_dates()
+  activity_to_vals = {a: frame.get_column(a) for a in activities \
+                          if frame.has_activity(a) and frame.get_valid(a).all()}
 
   moving_averages = {a: {} for a in activity_to_vals}
   rolling_averages = {a: {} for a in activity_to_vals}
@@ -80,12 +75,12 @@ def show_moving_averages(record_aggregation_types, record_units,
       mavg_graph.plot(show = False, save = True)
 
 
-def process_moving_averages(data_dict, record_aggregation_types, record_units,
+def process_moving_averages(frame, record_aggregation_types, record_units,
                             activities, min_weeks, max_weeks, consistent_periods,
                             use_rolling_avg, graph_sets):
   
   moving_averages, rolling_averages, overall_averages = \
-        build_moving_averages(data_dict, activities, min_weeks, max_weeks, consistent_periods)
+        build_moving_averages(frame, activities, min_weeks, max_weeks, consistent_periods)
   show_moving_averages(record_aggregation_types, record_units,
                         moving_averages, rolling_averages, overall_averages,
                         use_rolling_avg, graph_sets)
@@ -100,9 +95,9 @@ def moving_average():
   dio = dataio.DataIO(par.DataParams)
 
   data_csv = dio.get_csv_file(period = par.AggregationPeriod.DAILY)
-  data_dict = csvutil.CsvIO.read_data_csv(data_csv)
+  frame = dio.read_data(data_csv)
 
-  process_moving_averages(data_dict, record_aggregation_types, record_units,
+  process_moving_averages(frame, record_aggregation_types, record_units,
                           activities = par.MovingAverageParams.ACTIVITIES,
                           min_weeks = par.MovingAverageParams.MIN_WEEKS,
                           max_weeks = par.MovingAverageParams.MAX_WEEKS,
@@ -61,9 +61,83 @@ class DataParams:
   END_DATE = date(2026, 1, 1)
   PARSE_TIMEZONE = ParseTimezone.DATA_TIMEZONE
 
+class DataCacheParams:
+  # No. of CSV files whose data each script keeps in memory once read, until the least recently
+  #   used one is dropped. 0 to always read data again.
+  MEMORY_CACHE_SIZE = 8
+  # Also save the data of each CSV file as binary columns next to it, which are read instead of
+  #   the CSV file as long as it has not changed
+  DISK_CACHE = True
+
+class XmlBackend(Enum):
+  # xml.etree.ElementTree pull parser
+  ELEMENT_TREE = 0
+
+  # xml.parsers.expat callbacks, which only build attribute dicts of records
+  EXPAT = 1
+
+  # lxml pull parser, if lxml is installed
+  LXML = 2
+
+# Same fields as DataParams, to write another CSV file from the same parse
+@dataclass
+class OutputProfile:
+  PARSE_TIMEZONE:   ParseTimezone
+  START_DATE:       date
+  END_DATE:         date
+  FILENAME_SUFFIX:  str = ''
+
 class ParserParams:
+  # Either the XML file, or the zip file exported by Apple Health
   INPUT_FILENAME = '20260106.xml'
 
+  # Stream records from the XML file instead of loading the whole tree into memory
+  STREAM_XML = True
+  # Parser used to stream records. Compare them with benchmark.py.
+  XML_BACKEND = XmlBackend.ELEMENT_TREE
+  # Drop records that are not of RECORD_TYPES, Correlations and Workouts from the streamed bytes,
+  #   before they reach the parser. Requires STREAM_XML, and does not support SHOW_SUMMARY.
+  #   Only faster when most records are not of RECORD_TYPES (see README).
+  PREFILTER_RECORDS = False
+
+  # Read the XML file in a separate task from parsing it, so that reading overlaps with parsing.
+  #   Requires STREAM_XML, and is not used with PARALLEL_PARSE.
+  PIPELINE_PARSE = False
+  # Chunks read ahead of the parser, at most
+  PIPELINE_QUEUE_CHUNKS = 8
+
+  # Save hourly sums of the records parsed so far next to the CSV file, every so often, so that
+  #   an interrupted parse can be continued with: python parse_data.py --resume
+  #   Requires STREAM_XML, and does not support PREFILTER_RECORDS, PARALLEL_PARSE, SHOW_SUMMARY,
+  #   or a record cache or EXTRA_OUTPUT_PROFILES.
+  CHECKPOINT_PARSE = False
+
+  # Memory for hourly sums of records, in MB. Beyond that, they are written to temporary files,
+  #   and merged from there when aggregating. If 0, all are kept in memory.
+  #   Does not support INCREMENTAL_PARSE, PARALLEL_PARSE or CHECKPOINT_PARSE.
+  AGGREGATION_MEMORY_MB = 0
+
+  # Split the XML file into shards and parse them in parallel. Requires STREAM_XML.
+  PARALLEL_PARSE = False
+  # If 0, uses one shard per CPU
+  NUM_PARSE_SHARDS = 0
+
+  # Save parse state next to the CSV file. On the next run, only parse records that are newer
+  #   than before (by endDate or creationDate), and only aggregate days with new records again.
+  INCREMENTAL_PARSE = False
+
+  # Save all records of RECORD_TYPES (from any date, source or timezone) to a columnar cache
+  #   next to the XML file, so that CSV files for any DataParams can be built again from the
+  #   cache without reading the XML file.
+  WRITE_RECORD_CACHE = False
+  READ_RECORD_CACHE = False
+
+  # CSV files for these are written in addition to the one for DataParams, from the same parse.
+  EXTRA_OUTPUT_PROFILES = []
+
+  # Write parse throughput and time spent in each phase of the parse to a JSON file under out/
+  WRITE_PARSE_REPORT = False
+
   # Configure summary in XmlDebugParams
   SHOW_SUMMARY = False
 
@@ -87,6 +161,12 @@ class XmlDebugParams:
   SHOW_RECORD_UNIT_COUNTS = True
   SHOW_RECORD_SOURCE_COUNTS = False
 
+class BenchmarkParams:
+  # No. of synthetic records (or values) used by each benchmark
+  NUM_RECORDS = 200000
+  # Each benchmark reports the fastest of these runs
+  NUM_RUNS = 3
+
 class AggregationPeriod(Enum):
   DAILY = 0
   WEEKLY = 1
@@ -1,26 +1,138 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from functools import partial
+from os import cpu_count
 from xml.etree import ElementTree as ET
 
 import params as par
-from util import csvutil, dataio, paramutil
+from util import csvutil, dataio, instrument, paramutil
+from util import hour_spill as hsp
+from util import manifest as mfs
+from util import parse_state as pst
+from util import record_cache as rca
 from util import xml_debug as xdb
 from util import xml_parse as xpr
+from util import xml_pipeline as xpl
+from util import xml_shard as xsh
+from util import xml_stream as xst
 
-def process_xml(in_tree, start_date, end_date, parse_timezone,
-                show_summary = False, parse_data = True):
+def process_xml_shards(in_xml, start_date, end_date, parse_timezone, num_shards,
+                        record_watermarks = None, record_columns = None, tree_summary = None,
+                        parse_timer = None):
+  shard_ranges = xsh.XmlShards.get_shard_ranges(in_xml, num_shards)
+  print("Parsing {} shard(s)".format(len(shard_ranges)))
+
+  with ProcessPoolExecutor() as executor:
+    shard_futs = []
+    for byte_range in shard_ranges:
+      shard_futs.append(executor.submit(xpr.XmlParse.collect_xml_shard,
+                                        in_xml, byte_range,
+                                        start_date, end_date, parse_timezone,
+                                        record_watermarks, record_columns, tree_summary,
+                                        instrument.ParseTimer() if parse_timer else None))
+    shard_results = [sf.result() for sf in shard_futs]
+  
+  parse_stats = xpr.ParseStats()
+  for _, shard_parse_stats, shard_record_watermarks, shard_record_columns, shard_tree_summary, \
+        shard_parse_timer in shard_results:
+    parse_stats.merge(shard_parse_stats)
+    if record_watermarks:
+      record_watermarks.merge(shard_record_watermarks)
+    if record_columns is not None:
+      record_columns.merge(shard_record_columns)
+    if tree_summary:
+      tree_summary.merge(shard_tree_summary)
+    if parse_timer:
+      # Timings of parallel shards add up to more than the elapsed time.
+      parse_timer.merge(shard_parse_timer)
+  parse_stats.show()
+
+  return xpr.XmlParse.merge_xml_records([sr[0] for sr in shard_results])
+
+
+def process_xml(xml_data, start_date, end_date, parse_timezone,
+                show_summary = False, parse_data = True, num_shards = 0, parse_state = None,
+                record_columns = None, parse_timer = None, pipeline_queue_chunks = 0,
+                parse_checkpoint = None, hour_spill = None):
   start_time = datetime.now()
+  parse_timer = parse_timer or instrument.ParseTimer()
   
-  if show_summary:
-    xdb.XmlDebug.show_tree_summary(in_tree, start_date, end_date, parse_timezone)
+  if show_summary and not parse_data:
+    xdb.XmlDebug.show_tree_summary(xml_data, start_date, end_date, parse_timezone)
   if not parse_data:
     return None
+
+  # The summary is collected during the parse, instead of in a separate pass.
+  tree_summary = None
+  if show_summary:
+    tree_summary = xdb.TreeSummary(start_date, end_date, parse_timezone)
   
+  record_watermarks = None
+  if parse_state:
+    record_watermarks = pst.RecordWatermarks(parse_state.watermarks)
+    if parse_checkpoint and parse_checkpoint.watermarks:
+      record_watermarks.latest = dict(parse_checkpoint.watermarks)
+
   print()
   print("PROCESSING DATA")
-  records_by_date = xpr.XmlParse.parse_xml_data(in_tree, start_date, end_date,
-                                                parse_timezone,
-                                                show_checkpoints = True)
-  data_dict = csvutil.XmlToCsv.xml_dict_to_csv_dict(records_by_date)
+  if num_shards:
+    records_by_date = process_xml_shards(xml_data.in_xml, start_date, end_date,
+                                          parse_timezone, num_shards,
+                                          record_watermarks, record_columns, tree_summary,
+                                          parse_timer)
+  else:
+    parse_stats = parse_checkpoint.parse_stats if parse_checkpoint else xpr.ParseStats()
+    collect_xml_records = partial(xpr.XmlParse.collect_xml_records, xml_data, start_date, end_date,
+                                  parse_timezone, parse_stats,
+                                  show_checkpoints = True,
+                                  record_watermarks = record_watermarks,
+                                  record_columns = record_columns,
+                                  tree_summary = tree_summary,
+                                  parse_timer = parse_timer,
+                                  parse_checkpoint = parse_checkpoint,
+                                  hour_spill = hour_spill)
+    if pipeline_queue_chunks:
+      pipeline = xpl.ChunkPipeline(xml_data, pipeline_queue_chunks)
+      records_by_date = pipeline.run(collect_xml_records)
+    else:
+      records_by_date = collect_xml_records()
+    parse_stats.show()
+
+  if tree_summary:
+    tree_summary.show(xml_data)
+
+  with parse_timer.time_phase('aggregate'):
+    if parse_state:
+      # Only days with new records are aggregated again.
+      touched_days = parse_state.add_records(records_by_date)
+      parse_state.aggregate_days(touched_days)
+      parse_state.watermarks = record_watermarks.latest
+      records_by_date = parse_state.get_records_by_date()
+
+      print()
+      print("Aggregated {} updated day(s)".format(sum(len(td) for td in touched_days.values())))
+    elif hour_spill:
+      records_by_date = hour_spill.aggregate(records_by_date)
+    else:
+      records_by_date = xpr.XmlParse.aggregate_xml_records(records_by_date)
+    data_dict = csvutil.XmlToCsv.xml_dict_to_csv_dict(records_by_date)
+  
+  print()
+  print("Data processed in {}".format(datetime.now() - start_time))
+
+  return data_dict
+
+
+def process_record_columns(columns, source_names, start_date, end_date, parse_timezone,
+                            parse_timer = None):
+  start_time = datetime.now()
+  parse_timer = parse_timer or instrument.ParseTimer()
+
+  with parse_timer.time_phase('aggregate'):
+    records_by_date = rca.RecordCache.aggregate_records(columns, source_names,
+                                                        start_date, end_date, parse_timezone)
+    data_dict = csvutil.XmlToCsv.xml_dict_to_csv_dict(records_by_date)
   
   print()
   print("Data processed in {}".format(datetime.now() - start_time))
@@ -28,31 +140,202 @@ def process_xml(in_tree, start_date, end_date, parse_timezone,
   return data_dict
 
 
-def parse_data():
-  paramutil.Validator.validate_parse_data()
+def get_input_hashes(in_xml, cache_dir, data_params):
+  # Only params that change the output are hashed, not how it is parsed (or reported).
+  #   data_params is par.DataParams or one of the output profiles.
+  output_param_values = {
+      'INPUT_FILENAME': par.ParserParams.INPUT_FILENAME,
+      'SKIP_IPHONE_RECORDS': sorted(r.name for r in par.ParserParams.SKIP_IPHONE_RECORDS)}
+  input_hashes = {'raw file': mfs.OutputManifest.get_file_stat_hash(in_xml),
+                  'params': mfs.OutputManifest.get_params_hash([data_params, par.RecordParams],
+                                                                output_param_values),
+                  'code': mfs.OutputManifest.get_code_hash(__file__)}
+  if par.ParserParams.READ_RECORD_CACHE:
+    input_hashes['record cache'] = mfs.OutputManifest.get_file_stat_hash(cache_dir)
+  return input_hashes
+
+def parse_data(resume = False, force = False):
+  paramutil.Validator.validate_parse_data(resume)
 
   dio = dataio.DataIO(par.DataParams)
   in_xml = dio.get_raw_xml_filepath(par.ParserParams.INPUT_FILENAME)
   print("IN:\t{}".format(in_xml))
 
+  # Other output profiles are aggregated from record columns, collected in the same parse.
+  output_profiles = par.ParserParams.EXTRA_OUTPUT_PROFILES
+  cache_dir = dio.get_record_cache_dir(par.ParserParams.INPUT_FILENAME)
+
+  # The parse is skipped if all output files are current, unless it has other outputs.
+  manifest = mfs.OutputManifest(dio.get_manifest_file())
+  input_hashes = {dio.get_csv_file(): get_input_hashes(in_xml, cache_dir, par.DataParams)}
+  for output_profile in output_profiles:
+    input_hashes[dataio.DataIO(output_profile).get_csv_file()] = \
+        get_input_hashes(in_xml, cache_dir, output_profile)
+  if par.ParserParams.WRITE_DATA and not par.ParserParams.SHOW_SUMMARY and not resume:
+    outputs_current = all([manifest.check(out_csv, out_input_hashes, force = force) \
+                              for out_csv, out_input_hashes in input_hashes.items()])
+    if par.ParserParams.WRITE_RECORD_CACHE and not cache_dir.exists():
+      print("BUILD:\t{} (not built before)".format(cache_dir.name))
+      outputs_current = False
+    if outputs_current:
+      print()
+      print("Nothing to parse")
+      return
+
+  num_shards = 0
+  if par.ParserParams.PARALLEL_PARSE:
+    if dio.is_zip_file(in_xml):
+      # A compressed file cannot be split at byte offsets.
+      print("Parsing zip file serially")
+    else:
+      num_shards = par.ParserParams.NUM_PARSE_SHARDS or cpu_count()
+
+  parse_state = None
+  if par.ParserParams.INCREMENTAL_PARSE:
+    state_file = dio.get_parse_state_file()
+    params_key = pst.ParseState.get_params_key(par.DataParams.START_DATE,
+                                                par.DataParams.END_DATE,
+                                                par.DataParams.PARSE_TIMEZONE)
+    parse_state = pst.ParseState.load(state_file, params_key)
+    if parse_state:
+      print("INCREMENTAL:\t{}".format(state_file))
+    else:
+      print("INCREMENTAL:\tNo usable state, parsing all records")
+      parse_state = pst.ParseState(params_key)
+
+  parse_checkpoint = None
+  resumed_records = 0
+  if par.ParserParams.CHECKPOINT_PARSE:
+    checkpoint_file = dio.get_parse_checkpoint_file()
+    checkpoint_key = pst.ParseCheckpoint.get_params_key(in_xml,
+                                                        par.DataParams.START_DATE,
+                                                        par.DataParams.END_DATE,
+                                                        par.DataParams.PARSE_TIMEZONE,
+                                                        par.ParserParams.INCREMENTAL_PARSE)
+    if resume:
+      parse_checkpoint = pst.ParseCheckpoint.load(checkpoint_file, checkpoint_key)
+      if parse_checkpoint:
+        resumed_records = parse_checkpoint.num_records
+        print("RESUME:\t{} after {} records".format(checkpoint_file, resumed_records))
+      else:
+        print("RESUME:\tNo usable checkpoint, parsing all records")
+    if not parse_checkpoint:
+      parse_checkpoint = pst.ParseCheckpoint(checkpoint_key)
+      parse_checkpoint.out_file = checkpoint_file
+
+  record_columns = None
+  if par.ParserParams.WRITE_RECORD_CACHE or output_profiles:
+    record_columns = rca.RecordColumns()
+
+  hour_spill = None
+  if par.ParserParams.AGGREGATION_MEMORY_MB:
+    hour_spill = hsp.HourSpill(par.ParserParams.AGGREGATION_MEMORY_MB * (1 << 20))
+
   start_time = datetime.now()
-  in_tree = ET.parse(in_xml)
+  parse_timer = instrument.ParseTimer(total_bytes = dio.get_raw_xml_size(in_xml) \
+                                                      if in_xml.exists() else None)
+  if resumed_records and parse_timer.total_bytes:
+    parse_timer.total_bytes -= parse_checkpoint.records_offset
+  if par.ParserParams.READ_RECORD_CACHE:
+    print("CACHE:\t{}".format(cache_dir))
+    with parse_timer.time_phase('read'):
+      columns, source_names = rca.RecordCache.load_columns(cache_dir)
+
+    print()
+    print("PROCESSING CACHED RECORDS")
+    data_dict = process_record_columns(columns, source_names,
+                                        start_date = par.DataParams.START_DATE,
+                                        end_date = par.DataParams.END_DATE,
+                                        parse_timezone = par.DataParams.PARSE_TIMEZONE,
+                                        parse_timer = parse_timer)
+  else:
+    if par.ParserParams.STREAM_XML and parse_checkpoint:
+      xml_data = xst.XmlStream(in_xml, align_chunks = True,
+                                resume_offset = parse_checkpoint.records_offset)
+    elif par.ParserParams.STREAM_XML:
+      xml_data = xst.XmlStream(in_xml)
+    else:
+      with parse_timer.time_phase('read'), dio.open_raw_xml(in_xml) as xml_file:
+        xml_data = ET.parse(xml_file)
+      parse_timer.bytes_read += parse_timer.total_bytes
+
+      print()
+      print("Input read in {}".format(datetime.now() - start_time))
+
+    data_dict = process_xml(xml_data,
+                            start_date = par.DataParams.START_DATE,
+                            end_date = par.DataParams.END_DATE,
+                            parse_timezone = par.DataParams.PARSE_TIMEZONE,
+                            show_summary = par.ParserParams.SHOW_SUMMARY,
+                            parse_data = par.ParserParams.PARSE_DATA,
+                            num_shards = num_shards,
+                            parse_state = parse_state,
+                            record_columns = record_columns,
+                            parse_timer = parse_timer,
+                            pipeline_queue_chunks = par.ParserParams.PIPELINE_QUEUE_CHUNKS \
+                                                        if par.ParserParams.PIPELINE_PARSE else 0,
+                            parse_checkpoint = parse_checkpoint,
+                            hour_spill = hour_spill)
+    if record_columns is not None:
+      columns, source_names = record_columns.get_arrays()
+
+  if par.ParserParams.WRITE_RECORD_CACHE:
+    with parse_timer.time_phase('write'):
+      record_columns.save(cache_dir)
+    print()
+    print("Cached {} records in {}".format(len(record_columns), cache_dir))
 
-  print()
-  print("Input read in {}".format(datetime.now() - start_time))
-
-  data_dict = process_xml(in_tree,
-                          start_date = par.DataParams.START_DATE,
-                          end_date = par.DataParams.END_DATE,
-                          parse_timezone = par.DataParams.PARSE_TIMEZONE,
-                          show_summary = par.ParserParams.SHOW_SUMMARY,
-                          parse_data = par.ParserParams.PARSE_DATA)
   if par.ParserParams.WRITE_DATA:
-    out_csv = dio.get_csv_file()
-    csvutil.CsvIO.write_data_csv(out_csv, data_dict)
+    with parse_timer.time_phase('write'):
+      out_csv = dio.get_csv_file()
+      dio.write_data(out_csv, data_dict)
+      manifest.record(out_csv, input_hashes[out_csv])
+      if parse_state:
+        parse_state.save(state_file)
+
+  if parse_checkpoint:
+    # The parse is done, and cannot be resumed any more.
+    checkpoint_file.unlink(missing_ok = True)
+
+  for output_profile in output_profiles:
+    profile_dio = dataio.DataIO(output_profile)
+
+    print()
+    print("PROCESSING PROFILE: {}".format(profile_dio.get_csv_file().stem))
+    profile_data_dict = process_record_columns(columns, source_names,
+                                                start_date = output_profile.START_DATE,
+                                                end_date = output_profile.END_DATE,
+                                                parse_timezone = output_profile.PARSE_TIMEZONE,
+                                                parse_timer = parse_timer)
+    if par.ParserParams.WRITE_DATA:
+      with parse_timer.time_phase('write'):
+        profile_csv = profile_dio.get_csv_file()
+        profile_dio.write_data(profile_csv, profile_data_dict)
+        manifest.record(profile_csv, input_hashes[profile_csv])
+
+  parse_timer.show()
+  if par.ParserParams.WRITE_PARSE_REPORT:
+    report_info = {'input_file': par.ParserParams.INPUT_FILENAME,
+                    'parse_timezone': par.DataParams.PARSE_TIMEZONE.name,
+                    'start_date': str(par.DataParams.START_DATE),
+                    'end_date': str(par.DataParams.END_DATE),
+                    'stream_xml': par.ParserParams.STREAM_XML,
+                    'pipeline_parse': par.ParserParams.PIPELINE_PARSE,
+                    'resumed_records': resumed_records,
+                    'num_shards': num_shards,
+                    'incremental_parse': par.ParserParams.INCREMENTAL_PARSE,
+                    'read_record_cache': par.ParserParams.READ_RECORD_CACHE,
+                    'num_output_profiles': 1 + len(output_profiles)}
+    parse_timer.write_report(dio.get_parse_report_file(), report_info)
 
   print()
   print("DONE in {}".format(datetime.now() - start_time))
 
 if __name__ == '__main__':
-  parse_data()
+  arg_parser = argparse.ArgumentParser()
+  arg_parser.add_argument('--resume', action = 'store_true',
+                          help = "Continue from the last checkpoint (see CHECKPOINT_PARSE)")
+  arg_parser.add_argument('--force', action = 'store_true',
+                          help = "Parse even if output files are current")
+  args = arg_parser.parse_args()
+  parse_data(resume = args.resume, force = args.force)
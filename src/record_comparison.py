@@ -97,7 +97,7 @@ def make_comparisons_with_period_delta(all_values_by_date, all_deltas_by_date,
         comparator.compare_and_graph_values(r1_deltas_by_date, r2_deltas_by_date,
                                             tuple([par.ValueType.DELTA, par.ValueType.DELTA]))
 
-def make_all_comparisons(executor, data_dict, record_aggregation_types, record_units, period,
+def make_all_comparisons(executor, frame, record_aggregation_types, record_units, period,
                           max_period_delta, correlation_params):
   assert not record_aggregation_types.keys() ^ record_units.keys()
   
@@ -107,9 +107,9 @@ def make_all_comparisons(executor, data_dict, record_aggregation_types, record_u
   all_deltas_by_date = {}
   for r in record_types:
     all_values_by_date[r] = csvutil.CsvData.build_time_series_for_record(
-                                r, data_dict, unit = record_units[r])
+                                r, frame, unit = record_units[r])
     all_deltas_by_date[r] = csvutil.CsvData.build_time_deltas_for_record(
-                                r, data_dict, unit = record_units[r])
+                                r, frame, unit = record_units[r])
   
   pd_futs = []
   for pd in range(max_period_delta + 1):
@@ -132,12 +132,12 @@ def record_comparison():
     all_pd_futs = []
     for period in par.RecordComparisonParams.AGGREGATION_PERIODS:
       data_csv = dio.get_csv_file(period = period)
-      data_dict = csvutil.CsvIO.read_data_csv(data_csv)
+      frame = dio.read_data(data_csv)
 
       correlation_params = paramutil.RecordCorrelations.get_correlation_params()
 
       pd_futs = make_all_comparisons(executor,
-                    data_dict, record_aggregation_types, record_units, period = period,
+                    frame, record_aggregation_types, record_units, period = period,
                     max_period_delta = par.RecordComparisonParams.MAX_PERIOD_DELTAS[period],
                     correlation_params = correlation_params)
       all_pd_futs += pd_futs
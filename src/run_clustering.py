@@ -34,7 +34,7 @@ def get_groups_by_record(dataset, record_types, rescalers, r):
       groups.append(10)
   return groups
 
-def do_clustering(data_dict, record_aggregation_types, record_units, record_types, period):
+def do_clustering(frame, record_aggregation_types, record_units, record_types, period):
   assert not record_aggregation_types.keys() ^ record_units.keys()
   assert not record_types - record_aggregation_types.keys()
 
@@ -43,7 +43,7 @@ def do_clustering(data_dict, record_aggregation_types, record_units, record_type
 
   all_r_by_date = {}
   for r in record_types:
-    r_by_date = csvutil.CsvData.build_time_series_for_record(r, data_dict, record_units[r])
+    r_by_date = csvutil.CsvData.build_time_series_for_record(r, frame, record_units[r])
     all_r_by_date[r] = r_by_date
 
   all_dates = set()
@@ -113,9 +113,9 @@ def run_clustering():
 
   for period in par.ClusteringParams.AGGREGATION_PERIODS:
     data_csv = dio.get_csv_file(period = period)
-    data_dict = csvutil.CsvIO.read_data_csv(data_csv)
+    frame = dio.read_data(data_csv)
 
-    do_clustering(data_dict, record_aggregation_types, record_units,
+    do_clustering(frame, record_aggregation_types, record_units,
                   record_types = par.ClusteringParams.ACTIVITIES,
                   period = period)
 
@@ -0,0 +1,143 @@
+from datetime import date
+import numpy as np
+
+import params as par
+
+class ColumnAggregation:
+
+  _record_types = par.RecordParams.RECORD_TYPES
+  _hours_per_day = 24
+  _unrolled_sums = 8
+
+  @classmethod
+  def get_agg_type_codes(cls, num_record_codes):
+    agg_type_codes = np.full(num_record_codes, -1)
+    for rt in cls._record_types:
+      agg_type_codes[rt.record.value] = rt.aggregation.value
+    return agg_type_codes
+
+  @classmethod
+  def get_group_starts(cls, sorted_keys):
+    return np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+
+  @classmethod
+  def sum_rows(cls, matrix, counts):
+    # Adds up the first counts[i] values of each row in the same order as np.sum does (pairwise
+    #   summation, which uses 8 partial sums for 8 or more values), so that sums match it exactly.
+    num_rows, num_cols = matrix.shape
+    rows = np.arange(num_rows)
+
+    sums = np.full(num_rows, -0.0)
+    for c in range(min(cls._unrolled_sums - 1, num_cols)):
+      is_short = c < counts
+      is_short &= counts < cls._unrolled_sums
+      sums[is_short] += matrix[is_short, c]
+
+    is_long = counts >= cls._unrolled_sums
+    partial_sums = matrix[is_long, :cls._unrolled_sums].copy()
+    long_counts = counts[is_long]
+    for b in range(1, num_cols // cls._unrolled_sums):
+      in_block = long_counts >= (b + 1) * cls._unrolled_sums
+      partial_sums[in_block] += \
+          matrix[is_long][in_block, b * cls._unrolled_sums : (b + 1) * cls._unrolled_sums]
+    long_sums = ((partial_sums[:, 0] + partial_sums[:, 1]) \
+                    + (partial_sums[:, 2] + partial_sums[:, 3])) \
+                  + ((partial_sums[:, 4] + partial_sums[:, 5]) \
+                    + (partial_sums[:, 6] + partial_sums[:, 7]))
+    long_rows = rows[is_long]
+    remainder_starts = long_counts - long_counts % cls._unrolled_sums
+    for c in range(cls._unrolled_sums - 1):
+      in_remainder = remainder_starts + c < long_counts
+      long_sums[in_remainder] += \
+          matrix[long_rows[in_remainder], remainder_starts[in_remainder] + c]
+    sums[is_long] = long_sums
+
+    return sums
+
+  @classmethod
+  def aggregate_by_hour(cls, records, day_ordinals, hours, values, value_is_int):
+    # Returns one row per (record, day, hour), ordered by the first record in each hour.
+    first_day = day_ordinals.min()
+    num_days = int(day_ordinals.max() - first_day) + 1
+    hour_keys = (records.astype(np.int64) * num_days + (day_ordinals - first_day)) \
+                    * cls._hours_per_day + hours
+    hour_keys, first_indices, hour_groups = \
+        np.unique(hour_keys, return_index = True, return_inverse = True)
+
+    # bincount adds values in input order, same as a running sum.
+    hour_sums = np.bincount(hour_groups, weights = values, minlength = len(hour_keys))
+    hour_counts = np.bincount(hour_groups, minlength = len(hour_keys))
+    hour_is_int = np.bincount(hour_groups, weights = ~value_is_int.astype(bool),
+                              minlength = len(hour_keys)) == 0
+
+    day_keys = hour_keys // cls._hours_per_day
+    hour_records = day_keys // num_days
+    hour_days = day_keys % num_days + first_day
+
+    agg_types = cls.get_agg_type_codes(hour_records.max() + 1)[hour_records]
+    is_sum = agg_types == par.AggregateType.SUM.value
+    hour_values = np.where(is_sum, hour_sums, hour_sums / hour_counts)
+    hour_is_int &= is_sum
+
+    order = np.argsort(first_indices, kind = 'stable')
+    return hour_records[order], hour_days[order], hour_values[order], hour_is_int[order]
+
+  @classmethod
+  def aggregate_by_day(cls, hour_records, hour_days, hour_values, hour_is_int):
+    # Hours keep their order within each day, since sums depend on the order of values.
+    order = np.lexsort((np.arange(len(hour_records)), hour_days, hour_records))
+    hour_records = hour_records[order]
+    hour_days = hour_days[order]
+    hour_values = hour_values[order]
+    hour_is_int = hour_is_int[order]
+
+    day_keys = hour_records.astype(np.int64) * (hour_days.max() + 1) + hour_days
+    day_starts = cls.get_group_starts(day_keys)
+    day_groups = np.cumsum(np.r_[False, day_keys[1:] != day_keys[:-1]])
+    day_counts = np.diff(np.r_[day_starts, len(day_keys)])
+    day_records = hour_records[day_starts]
+    day_days = hour_days[day_starts]
+
+    hours_by_day = np.zeros((len(day_starts), cls._hours_per_day))
+    hours_by_day[day_groups, np.arange(len(day_keys)) - day_starts[day_groups]] = hour_values
+    day_sums = cls.sum_rows(hours_by_day, day_counts)
+
+    # 'nearest' percentile of sorted hourly values, rounding half to even like np.percentile
+    median_order = np.lexsort((hour_values, day_groups))
+    median_indices = day_starts + np.around((day_counts - 1) * 0.5).astype(int)
+    day_medians = hour_values[median_order][median_indices]
+
+    agg_types = cls.get_agg_type_codes(day_records.max() + 1)[day_records]
+    day_values = np.select([agg_types == par.AggregateType.SUM.value,
+                            agg_types == par.AggregateType.AVERAGE.value,
+                            agg_types == par.AggregateType.MEDIAN.value],
+                            [day_sums, day_sums / day_counts, day_medians])
+    day_is_int = np.bincount(day_groups, weights = ~hour_is_int,
+                              minlength = len(day_starts)) == 0
+    day_is_int &= agg_types == par.AggregateType.SUM.value
+
+    return day_records, day_days, day_values, day_is_int
+
+  @classmethod
+  def to_records_by_date(cls, day_records, day_days, day_values, day_is_int):
+    records_by_date = {rt.record: {} for rt in cls._record_types}
+    records_by_code = {rt.record.value: rt.record for rt in cls._record_types}
+    dates_by_ordinal = {}
+    for code, d, v, is_int in zip(day_records.tolist(), day_days.tolist(),
+                                  day_values.tolist(), day_is_int.tolist()):
+      if d not in dates_by_ordinal:
+        dates_by_ordinal[d] = date.fromordinal(d)
+      # Aggregates are NumPy scalars, same as from util.xml_parse.XmlParse.
+      records_by_date[records_by_code[code]][dates_by_ordinal[d]] = \
+          np.int64(v) if is_int else np.float64(v)
+    return records_by_date
+
+  @classmethod
+  def aggregate_columns(cls, records, day_ordinals, hours, values, value_is_int):
+    # Matches util.xml_parse.XmlParse.aggregate_xml_records over the same records in file order.
+    if not len(records):
+      return {rt.record: {} for rt in cls._record_types}
+
+    hourly_columns = cls.aggregate_by_hour(records, day_ordinals, hours, values, value_is_int)
+    daily_columns = cls.aggregate_by_day(*hourly_columns)
+    return cls.to_records_by_date(*daily_columns)
@@ -1,14 +1,17 @@
-from csv import DictReader, DictWriter
+from csv import DictReader, DictWriter, reader as csv_reader
 from datetime import datetime, date
+from itertools import islice
+import numpy as np
 
 import params as par
-from . import timeutil
+from . import daily_frame, valueutil
 
 class CsvIO:
 
   _date_field_csv = 'date'
   _restval = 'NA'
   _csv_dialect = 'excel'
+  _read_batch_rows = 4096
 
   @classmethod
   def read_data_csv(cls, in_csv):
@@ -21,18 +24,91 @@ class CsvIO:
       for row in reader:
         csv_data.append(row)
     
+    malformed_values = 0
     data_dict = {}
     for row in csv_data:
       d = date.fromisoformat(row['date'])
-      data_dict[d] = {par.Activity[r]: eval(v) for (r, v) in row.items() \
-                                    if not r == 'date' and not v == cls._restval}
+      data_dict[d] = {}
+      for r, v in row.items():
+        if r == 'date' or v == cls._restval:
+          continue
+        v = valueutil.ValueDecoder.try_decode(v)
+        if v is None:
+          malformed_values += 1
+          continue
+        data_dict[d][par.Activity[r]] = v
     
     print()
     print(in_csv)
+    if malformed_values:
+      print("Skipped {} malformed value(s)".format(malformed_values))
     print("CSV read in {}".format(datetime.now() - start_time))
     
     return data_dict
   
+  @classmethod
+  def decode_cells(cls, cells):
+    # Date and value columns of a (rows x fields) array of CSV cells, and no. of malformed values
+    dates = cells[:, 0].astype('datetime64[D]')
+    value_cells = cells[:, 1 : ]
+    missing = value_cells == cls._restval
+    value_cells = np.where(missing, 'nan', value_cells)
+    try:
+      values = value_cells.astype(np.float64)
+    except ValueError:
+      # Only if there are malformed values: decoded one at a time
+      values = np.array([[valueutil.ValueDecoder.try_decode(v) for v in row] \
+                            for row in value_cells.tolist()],
+                        dtype = np.float64)
+    # Values that are not finite are malformed as well, and skipped.
+    malformed = ~missing & ~np.isfinite(values)
+    values[malformed] = np.nan
+    return dates, values, np.count_nonzero(malformed)
+
+  @classmethod
+  def read_data_frame(cls, in_csv):
+    # Same values as read_data_csv, read into a util.daily_frame.DailyFrame. Rows are read in one
+    #   pass, and converted to columns a batch at a time. Activities are looked up once per file.
+    start_time = datetime.now()
+
+    date_batches = []
+    value_batches = []
+    malformed_values = 0
+    with open(in_csv, newline = '') as csv_file:
+      rows = csv_reader(csv_file, dialect = cls._csv_dialect)
+      header = next(rows, [cls._date_field_csv])
+      assert header[0] == cls._date_field_csv, \
+          "First CSV column must be {}".format(cls._date_field_csv)
+      activities = [par.Activity[r] for r in header[1 : ]]
+      num_fields = len(header)
+
+      while batch_rows := list(islice(rows, cls._read_batch_rows)):
+        cells = np.array([row if len(row) == num_fields \
+                              else (row + [cls._restval] * num_fields)[ : num_fields] \
+                              for row in batch_rows if row],
+                          dtype = str).reshape(-1, num_fields)
+        batch_dates, batch_values, batch_malformed_values = cls.decode_cells(cells)
+        date_batches.append(batch_dates)
+        value_batches.append(batch_values)
+        malformed_values += batch_malformed_values
+
+    dates = np.concatenate(date_batches) if date_batches else np.array([], dtype = 'datetime64[D]')
+    values = np.concatenate(value_batches) if value_batches \
+                else np.zeros((0, len(activities)), dtype = np.float64)
+    if not np.all(dates[1 : ] >= dates[ : -1]):
+      date_order = np.argsort(dates, kind = 'stable')
+      dates = dates[date_order]
+      values = values[date_order]
+    values = np.asfortranarray(values)
+
+    print()
+    print(in_csv)
+    if malformed_values:
+      print("Skipped {} malformed value(s)".format(malformed_values))
+    print("CSV read in {}".format(datetime.now() - start_time))
+
+    return daily_frame.DailyFrame(dates, activities, values, ~np.isnan(values))
+
   @classmethod
   def write_data_csv(cls, out_csv, data_dict):
     fields = set()
@@ -85,31 +161,23 @@ class XmlToCsv:
 class CsvData:
 
   @classmethod
-  def build_time_series_for_record(cls, r, data_dict, unit,
-                                    start_date = None, end_date = None,
-                                    sort = False):
-    r_by_date = {}
-    for d in data_dict:
-      if r not in data_dict[d]:
-        continue
-      if not timeutil.DatetimeUtil.check_date_range(d, start_date, end_date):
-        continue
-      if data_dict[d][r] == 0:
-        continue
-      r_by_date[d] = data_dict[d][r]
-      if unit == '%':
-        r_by_date[d] *= 100.0
-    
-    if sort:
-      r_by_date = {d: v for d, v in sorted(r_by_date.items())}
-    
-    return r_by_date
+  def build_time_series_for_record(cls, r, frame, unit, start_date = None, end_date = None):
+    # Valid, non-zero values of r in a util.daily_frame.DailyFrame, by date in sorted order
+    if not frame.has_activity(r):
+      return {}
+
+    frame = frame.get_date_range(start_date, end_date)
+    values = frame.get_column(r)
+    kept = frame.get_valid(r) & (values != 0)
+    values = values[kept]
+    if unit == '%':
+      values = values * 100.0
+
+    return dict(zip(frame.dates[kept].tolist(), values.tolist()))
 
   @classmethod
-  def build_time_deltas_for_record(cls, r, data_dict, unit, start_date = None, end_date = None):
-    r_by_date = cls.build_time_series_for_record(r, data_dict, unit,
-                                                  start_date, end_date,
-                                                  sort = True)
+  def build_time_deltas_for_record(cls, r, frame, unit, start_date = None, end_date = None):
+    r_by_date = cls.build_time_series_for_record(r, frame, unit, start_date, end_date)
 
     delta_by_date = {}
     for d in r_by_date:
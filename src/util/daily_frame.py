@@ -0,0 +1,71 @@
+import numpy as np
+
+import params as par
+
+class DailyFrame:
+
+  __slots__ = ('dates', 'activities', 'values', 'valid', 'activity_indices')
+
+  # Values of each Activity by date (or by period start date), in place of a dict per date.
+  #   dates is a sorted datetime64[D] array, and values a (dates x activities) float64 matrix in
+  #   column-major order, so that the values of each Activity are contiguous. Missing values are
+  #   NaN, and not valid.
+  def __init__(self, dates, activities, values, valid):
+    assert len(dates) == values.shape[0] == valid.shape[0]
+    assert len(activities) == values.shape[1] == valid.shape[1]
+
+    self.dates = dates
+    self.activities = activities
+    self.values = values
+    self.valid = valid
+    self.activity_indices = {r: j for j, r in enumerate(activities)}
+
+  @classmethod
+  def from_data_dict(cls, data_dict):
+    # data_dict maps dates to {Activity: value}, or to {Activity name: value} as written to CSV.
+    names = set()
+    for d in data_dict:
+      names = names | {r.name if isinstance(r, par.Activity) else r for r in data_dict[d]}
+    activities = [par.Activity[n] for n in sorted(names)]
+    activity_indices = {r.name: j for j, r in enumerate(activities)}
+
+    dates = sorted(data_dict.keys())
+    values = np.full((len(dates), len(activities)), np.nan, dtype = np.float64, order = 'F')
+    for i, d in enumerate(dates):
+      for r, v in data_dict[d].items():
+        values[i, activity_indices[r.name if isinstance(r, par.Activity) else r]] = v
+
+    return cls(np.array(dates, dtype = 'datetime64[D]'), activities, values, ~np.isnan(values))
+
+  def to_data_dict(self, by_name = False):
+    # Only valid values are kept, as in util.csvutil.CsvIO.read_data_csv
+    keys = [r.name for r in self.activities] if by_name else self.activities
+    data_dict = {d: {} for d in self.dates.tolist()}
+    for j, r in enumerate(keys):
+      for d, v, is_valid in zip(data_dict, self.values[:, j].tolist(), self.valid[:, j].tolist()):
+        if is_valid:
+          data_dict[d][r] = v
+    return data_dict
+
+  def __len__(self):
+    return len(self.dates)
+
+  def get_dates(self):
+    return self.dates.tolist()
+
+  def has_activity(self, r):
+    return r in self.activity_indices
+
+  def get_column(self, r):
+    # A view, not a copy
+    return self.values[:, self.activity_indices[r]]
+
+  def get_valid(self, r):
+    return self.valid[:, self.activity_indices[r]]
+
+  def get_date_range(self, start_date = None, end_date = None):
+    # Dates from start_date up to (not including) end_date, as views of this frame
+    start = np.searchsorted(self.dates, np.datetime64(start_date, 'D')) if start_date else 0
+    end = np.searchsorted(self.dates, np.datetime64(end_date, 'D')) if end_date else len(self)
+    return DailyFrame(self.dates[start : end], self.activities,
+                      self.values[start : end], self.valid[start : end])
@@ -0,0 +1,36 @@
+from collections import OrderedDict
+
+import params as par
+from . import data_columns
+
+class DataCache:
+
+  # Resolved CSV path -> (CSV key, util.daily_frame.DailyFrame), least recently used first
+  _frames = OrderedDict()
+
+  # Data of CSV files already read (or written) by this process. Entries are only used while the
+  #   CSV file has the same size and mtime. Cached frames are shared, so they are made read-only.
+  @classmethod
+  def get(cls, csv_file):
+    csv_path = csv_file.resolve()
+    if csv_path not in cls._frames:
+      return None
+    csv_key, frame = cls._frames[csv_path]
+    if not csv_key == data_columns.DataColumns.get_csv_key(csv_path):
+      del cls._frames[csv_path]
+      return None
+    cls._frames.move_to_end(csv_path)
+    return frame
+
+  @classmethod
+  def put(cls, csv_file, frame):
+    if not par.DataCacheParams.MEMORY_CACHE_SIZE:
+      return
+    for column in [frame.dates, frame.values, frame.valid]:
+      column.flags.writeable = False
+
+    csv_path = csv_file.resolve()
+    cls._frames[csv_path] = tuple([data_columns.DataColumns.get_csv_key(csv_path), frame])
+    cls._frames.move_to_end(csv_path)
+    while len(cls._frames) > par.DataCacheParams.MEMORY_CACHE_SIZE:
+      cls._frames.popitem(last = False)
@@ -0,0 +1,59 @@
+from datetime import datetime
+import json
+import numpy as np
+
+import params as par
+from . import daily_frame, dataio
+
+class DataColumns:
+
+  # Arrays of a util.daily_frame.DailyFrame. Values are saved in column-major order, so that the
+  #   values of each Activity are contiguous in the file.
+  _columns = ['dates', 'values', 'valid']
+  _meta_file = 'columns.json'
+
+  # A binary copy of a CSV file of daily (or periodly) data, written next to it (see
+  #   util.dataio.DataIO). It is memory-mapped when read, and only used while the CSV file is the
+  #   same as when it was written, since the CSV file is what gets shared and edited.
+  @classmethod
+  def get_csv_key(cls, csv_file):
+    csv_stat = csv_file.stat()
+    return [csv_stat.st_size, csv_stat.st_mtime_ns]
+
+  @classmethod
+  def save(cls, columns_dir, frame, csv_file):
+    with dataio.DataIO.write_replacing(columns_dir, is_dir = True) as tmp_dir:
+      for c in cls._columns:
+        np.save(tmp_dir / (c + '.npy'), getattr(frame, c))
+      with open(tmp_dir / cls._meta_file, 'w') as meta_file:
+        json.dump({'activities': [r.name for r in frame.activities],
+                    'csv_key': cls.get_csv_key(csv_file)}, meta_file)
+
+  @classmethod
+  def load_meta(cls, columns_dir):
+    meta_path = columns_dir / cls._meta_file
+    if not meta_path.exists():
+      return None
+    with open(meta_path) as meta_file:
+      return json.load(meta_file)
+
+  @classmethod
+  def is_current(cls, columns_dir, csv_file):
+    meta = cls.load_meta(columns_dir)
+    return bool(meta) and meta.get('csv_key') == cls.get_csv_key(csv_file) \
+              and all((columns_dir / (c + '.npy')).exists() for c in cls._columns)
+
+  @classmethod
+  def load_frame(cls, columns_dir):
+    start_time = datetime.now()
+
+    columns = {c: np.load(columns_dir / (c + '.npy'), mmap_mode = 'r') for c in cls._columns}
+    activities = [par.Activity[n] for n in cls.load_meta(columns_dir)['activities']]
+    frame = daily_frame.DailyFrame(columns['dates'], activities, columns['values'],
+                                    columns['valid'])
+
+    print()
+    print(columns_dir)
+    print("Columns read in {}".format(datetime.now() - start_time))
+
+    return frame
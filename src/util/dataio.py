@@ -1,8 +1,16 @@
+from contextlib import contextmanager
 from pathlib import Path
+import shutil
+import zipfile
 
 import params as par
+from . import csvutil, daily_frame, data_cache, data_columns, timeutil
 
 class DataIO:
+
+  # Path of the XML file inside the zip file exported by Apple Health
+  _zip_xml_filename = 'apple_health_export/export.xml'
+
   def __init__(self, data_params):
     self.data_params = data_params
 
@@ -21,6 +29,52 @@ class DataIO:
   def get_raw_xml_filepath(self, filename):
     return self.raw_data_dir / filename
   
+  @classmethod
+  def is_zip_file(cls, filepath):
+    return zipfile.is_zipfile(filepath)
+
+  @classmethod
+  def open_raw_xml(cls, filepath):
+    # The XML file in a zip file is decompressed as it is read, without extracting it.
+    if not cls.is_zip_file(filepath):
+      return open(filepath, 'rb')
+    with zipfile.ZipFile(filepath) as zip_file:
+      return zip_file.open(cls._zip_xml_filename)
+
+  @classmethod
+  def get_raw_xml_size(cls, filepath):
+    # Size of the XML file, uncompressed if it is in a zip file
+    if not cls.is_zip_file(filepath):
+      return filepath.stat().st_size
+    with zipfile.ZipFile(filepath) as zip_file:
+      return zip_file.getinfo(cls._zip_xml_filename).file_size
+
+  @classmethod
+  @contextmanager
+  def write_replacing(cls, out_path, is_dir = False):
+    # Yields a temporary path to write to, which then replaces out_path, so that a failed write
+    #   keeps the previous file (or directory). A directory cannot replace another one in a single
+    #   rename, so the previous one is renamed aside first, and deleted once the new one is in.
+    tmp_path = out_path.with_name(out_path.name + '.tmp')
+    if is_dir:
+      shutil.rmtree(tmp_path, ignore_errors = True)
+      tmp_path.mkdir(parents = True)
+
+    yield tmp_path
+
+    if not is_dir:
+      tmp_path.replace(out_path)
+      return
+    old_path = out_path.with_name(out_path.name + '.old')
+    shutil.rmtree(old_path, ignore_errors = True)
+    if out_path.exists():
+      out_path.rename(old_path)
+    tmp_path.rename(out_path)
+    shutil.rmtree(old_path, ignore_errors = True)
+
+  def get_record_cache_dir(self, raw_filename):
+    return self.raw_data_dir / (raw_filename + '.records')
+
   def get_parsed_csv_filepath(self, filename):
     return self.parsed_data_dir / filename
   
@@ -43,3 +97,57 @@ class DataIO:
                           suffix = self.data_params.FILENAME_SUFFIX)
 
     return self.get_parsed_csv_filepath(csv_filename)
+
+  @classmethod
+  def get_columns_dir(cls, csv_file):
+    return csv_file.with_suffix('.columns')
+
+  @classmethod
+  def write_data(cls, out_csv, data_dict):
+    cls.write_frame(out_csv, daily_frame.DailyFrame.from_data_dict(data_dict),
+                    data_dict = data_dict)
+
+  @classmethod
+  def write_frame(cls, out_csv, frame, data_dict = None):
+    # CSV files are what gets shared. Columns are written next to them, for scripts to read fast.
+    #   data_dict, if set, is written to the CSV file instead of the frame, to keep ints as such.
+    csvutil.CsvIO.write_data_csv(out_csv, data_dict or frame.to_data_dict(by_name = True))
+    if par.DataCacheParams.DISK_CACHE:
+      data_columns.DataColumns.save(cls.get_columns_dir(out_csv), frame, out_csv)
+    data_cache.DataCache.put(out_csv, frame)
+
+  @classmethod
+  def read_data(cls, in_csv):
+    # Returns a util.daily_frame.DailyFrame: from memory if this process has read it already, or
+    #   else from columns next to the CSV file, unless the CSV file has changed since.
+    frame = data_cache.DataCache.get(in_csv)
+    if frame is not None:
+      print()
+      print(in_csv)
+      print("Data found in memory")
+      return frame
+
+    columns_dir = cls.get_columns_dir(in_csv)
+    if par.DataCacheParams.DISK_CACHE \
+        and data_columns.DataColumns.is_current(columns_dir, in_csv):
+      frame = data_columns.DataColumns.load_frame(columns_dir)
+    else:
+      frame = csvutil.CsvIO.read_data_frame(in_csv)
+      if par.DataCacheParams.DISK_CACHE:
+        data_columns.DataColumns.save(columns_dir, frame, in_csv)
+
+    data_cache.DataCache.put(in_csv, frame)
+    return frame
+
+  def get_manifest_file(self):
+    return self.parsed_data_dir / 'manifest.json'
+
+  def get_parse_state_file(self):
+    return self.get_csv_file().with_suffix('.state.npz')
+
+  def get_parse_checkpoint_file(self):
+    return self.get_csv_file().with_suffix('.checkpoint.npz')
+
+  def get_parse_report_file(self):
+    return self.graph_dir / 'parse' / "{}_{}.json".format(self.get_csv_file().stem,
+                                                          timeutil.Timestamp.get_timestamp())
@@ -0,0 +1,147 @@
+from datetime import date
+import heapq
+import numpy as np
+import tempfile
+from pathlib import Path
+
+import params as par
+from . import parse_state, xml_parse
+
+class HourSpill:
+
+  _record_types = par.RecordParams.RECORD_TYPES
+
+  # Rough size of one hourly [sum, count] in nested dicts, in bytes. It is about 150 when most
+  #   hours of a day have records, and more for sparse days.
+  _bytes_per_hour = 250
+  # Each record adds at most one hour, so checking often enough keeps within the budget.
+  _max_check_every_n_records = 100000
+
+  _columns = ['records', 'days', 'hours', 'sums', 'is_int', 'counts', 'orders']
+  _merge_block_rows = 1 << 16
+  _aggregate_batch_days = 10000
+
+  # Keeps hourly [sum, count] of records within a memory budget. Whenever there are more hours
+  #   than fit, they are written to a sorted run in a temporary folder and dropped from memory.
+  #   Runs are merged when aggregating, one day at a time.
+  def __init__(self, memory_budget_bytes):
+    self.max_hours = max(1, memory_budget_bytes // self._bytes_per_hour)
+    self.check_every_n_records = max(1, min(self._max_check_every_n_records,
+                                            self.max_hours // 10))
+    self.spill_dir = None
+    self.num_runs = 0
+    self.spilled_hours = 0
+
+  @classmethod
+  def count_hours(cls, records_by_date):
+    return sum(len(hours) for r in records_by_date for hours in records_by_date[r].values())
+
+  def check(self, records_by_date):
+    if self.count_hours(records_by_date) > self.max_hours:
+      self.spill(records_by_date)
+
+  def get_run_dir(self, run_index):
+    return Path(self.spill_dir.name) / "run_{}".format(run_index)
+
+  def spill(self, records_by_date):
+    rows = []
+    for r in records_by_date:
+      for d, hours in records_by_date[r].items():
+        # Hours keep their order within each day, since sums depend on the order of values.
+        for order, (hr, (hour_sum, hour_count)) in enumerate(hours.items()):
+          rows.append(tuple([r.value, d.toordinal(), hr,
+                              *parse_state.ParseState.to_stored_value(hour_sum), hour_count,
+                              order]))
+      records_by_date[r].clear()
+    if not rows:
+      return
+
+    if not self.spill_dir:
+      self.spill_dir = tempfile.TemporaryDirectory(prefix = 'apple_health_spill_')
+    run_dir = self.get_run_dir(self.num_runs)
+    run_dir.mkdir()
+
+    run_columns = list(zip(*rows))
+    run_columns = [np.array(run_columns[0], dtype = np.int16),
+                    np.array(run_columns[1], dtype = np.int32),
+                    np.array(run_columns[2], dtype = np.int8),
+                    np.array(run_columns[3], dtype = np.float64),
+                    np.array(run_columns[4], dtype = bool),
+                    np.array(run_columns[5], dtype = np.int64),
+                    np.array(run_columns[6], dtype = np.int32)]
+    run_order = np.lexsort((run_columns[2], run_columns[1], run_columns[0]))
+    for c, column in zip(self._columns, run_columns):
+      np.save(run_dir / (c + '.npy'), column[run_order])
+
+    self.num_runs += 1
+    self.spilled_hours += len(rows)
+    print("Spilled {} hour(s) to run {}".format(len(rows), self.num_runs))
+
+  def iter_run_rows(self, run_index):
+    # Rows of (record, day, hour, run, sum, is_int, count, order), read a block at a time
+    run_dir = self.get_run_dir(run_index)
+    run_columns = [np.load(run_dir / (c + '.npy'), mmap_mode = 'r') for c in self._columns]
+    for start in range(0, len(run_columns[0]), self._merge_block_rows):
+      block_columns = [column[start : start + self._merge_block_rows].tolist() \
+                          for column in run_columns]
+      for r, d, hr, hour_sum, is_int, hour_count, order in zip(*block_columns):
+        yield r, d, hr, run_index, hour_sum, is_int, hour_count, order
+
+  @classmethod
+  def add_day(cls, records_by_date, day_key, day_hours):
+    # Hours in the order in which they were first seen: by run, and by order within the run
+    r, d = day_key
+    records_by_date[par.Activity(r)][date.fromordinal(d)] = \
+        {hr: [hour_sum, hour_count] \
+            for hr, (_, hour_sum, hour_count) in sorted(day_hours.items(), key = lambda h: h[1][0])}
+
+  def aggregate(self, records_by_date):
+    # Same as util.xml_parse.XmlParse.aggregate_xml_records, but also for spilled hours.
+    #   Sums of an hour that is split across runs are added up per run, which can differ from
+    #   a running sum in the last bit.
+    if not self.num_runs:
+      return xml_parse.XmlParse.aggregate_xml_records(records_by_date)
+
+    self.spill(records_by_date)
+    print("Merging {} run(s) of {} hour(s)".format(self.num_runs, self.spilled_hours))
+
+    daily_values = {rt.record: {} for rt in self._record_types}
+    batch_records_by_date = {rt.record: {} for rt in self._record_types}
+    batch_days = 0
+    day_key = None
+    day_hours = {}
+    merged_rows = heapq.merge(*[self.iter_run_rows(i) for i in range(self.num_runs)])
+    for r, d, hr, run_index, hour_sum, is_int, hour_count, order in merged_rows:
+      if not (r, d) == day_key:
+        if day_key:
+          self.add_day(batch_records_by_date, day_key, day_hours)
+          batch_days += 1
+        if batch_days >= self._aggregate_batch_days:
+          self.add_batch(daily_values, batch_records_by_date)
+          batch_days = 0
+        day_key = (r, d)
+        day_hours = {}
+
+      # Rows of the same hour come in run order.
+      hour_sum = parse_state.ParseState.from_stored_value(hour_sum, is_int)
+      if hr not in day_hours:
+        day_hours[hr] = [tuple([run_index, order]), hour_sum, hour_count]
+      else:
+        day_hours[hr][1] += hour_sum
+        day_hours[hr][2] += hour_count
+    if day_key:
+      self.add_day(batch_records_by_date, day_key, day_hours)
+    self.add_batch(daily_values, batch_records_by_date)
+
+    self.spill_dir.cleanup()
+    self.spill_dir = None
+    self.num_runs = 0
+    self.spilled_hours = 0
+    return daily_values
+
+  @classmethod
+  def add_batch(cls, daily_values, batch_records_by_date):
+    xml_parse.XmlParse.aggregate_xml_records(batch_records_by_date)
+    for r in batch_records_by_date:
+      daily_values[r].update(batch_records_by_date[r])
+      batch_records_by_date[r].clear()
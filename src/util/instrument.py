@@ -0,0 +1,94 @@
+from contextlib import contextmanager
+from datetime import timedelta
+import json
+from time import perf_counter
+
+
+class ParseTimer:
+
+  _phases = ['read', 'match', 'datetime decode', 'value decode', 'accumulate', 'aggregate',
+              'write']
+
+  # Phases within the parse loop are only timed on every n-th record, and scaled up. The rest of
+  #   the parse loop (reading XML, and checks that drop records) counts as 'read'. Datetimes are
+  #   decoded and adjusted to a timezone in one step.
+  _sample_every_n_records = 64
+
+  def __init__(self, total_bytes = None):
+    self.total_bytes = total_bytes
+    self.start_time = perf_counter()
+
+    self.phase_seconds = {p: 0.0 for p in self._phases}
+    self.num_records = 0
+    self.bytes_read = 0
+
+  @contextmanager
+  def time_phase(self, phase):
+    start_time = perf_counter()
+    yield
+    self.phase_seconds[phase] += perf_counter() - start_time
+
+  def is_sampled(self, i):
+    return i % self._sample_every_n_records == 0
+
+  def add_sample(self, phase, start_time):
+    # Adds a phase of a sampled record in the parse loop, scaled up. Returns the time it ended.
+    end_time = perf_counter()
+    self.phase_seconds[phase] += (end_time - start_time) * self._sample_every_n_records
+    return end_time
+
+  def add_loop(self, loop_seconds, num_records, bytes_read, loop_phase_seconds):
+    # loop_phase_seconds are the phases before the loop started. Phases timed within the loop
+    #   (sampled loop phases, and writing checkpoints) are not counted as 'read'.
+    sampled_seconds = sum(self.phase_seconds[p] - loop_phase_seconds[p] for p in self._phases)
+    self.phase_seconds['read'] += max(0.0, loop_seconds - sampled_seconds)
+    self.num_records += num_records
+    self.bytes_read += bytes_read or 0
+
+  def merge(self, other):
+    for p in self._phases:
+      self.phase_seconds[p] += other.phase_seconds[p]
+    self.num_records += other.num_records
+    self.bytes_read += other.bytes_read
+
+  def get_elapsed_seconds(self):
+    return perf_counter() - self.start_time
+
+  def show_progress(self, num_records, bytes_read = None, resumed_records = 0):
+    # num_records includes records parsed before a resumed parse, which are not in the rate.
+    seconds = self.get_elapsed_seconds()
+    progress = "Processed: {}\t{:.0f} records/s".format(num_records,
+                                                        (num_records - resumed_records) / seconds)
+    if bytes_read:
+      progress += "\t{:.1f} MB/s".format(bytes_read / seconds / 1e6)
+    if bytes_read and self.total_bytes:
+      fraction_done = bytes_read / self.total_bytes
+      eta = timedelta(seconds = round(seconds * (1 - fraction_done) / fraction_done))
+      progress += "\t{:.1f}% done\tETA {}".format(fraction_done * 100, eta)
+    print(progress)
+
+  def get_report(self):
+    seconds = self.get_elapsed_seconds()
+    return {'records': self.num_records,
+            'bytes_read': self.bytes_read,
+            'total_bytes': self.total_bytes,
+            'seconds': seconds,
+            'records_per_second': self.num_records / seconds,
+            'bytes_per_second': self.bytes_read / seconds,
+            'phase_seconds': dict(self.phase_seconds)}
+
+  def show(self):
+    report = self.get_report()
+    print()
+    print("PARSE TIMINGS")
+    print("\t{:.0f} records/s\t{:.1f} MB/s".format(report['records_per_second'],
+                                                  report['bytes_per_second'] / 1e6))
+    for p, seconds in report['phase_seconds'].items():
+      print("\t{:<16}{:8.3f} s".format(p, seconds))
+
+  def write_report(self, out_file, report_info):
+    out_file.parent.mkdir(exist_ok = True, parents = True)
+    with open(out_file, 'w') as report_file:
+      json.dump(report_info | self.get_report(), report_file, indent = 2)
+    print()
+    print("Parse report written to: {}".format(out_file))
@@ -0,0 +1,88 @@
+import hashlib
+import json
+from pathlib import Path
+
+from . import data_columns, dataio
+
+class OutputManifest:
+
+  _util_dir = Path(__file__).parent
+  _file_hash_block_size = 1 << 20
+
+  # Hashes of the inputs of each output file, when it was last written, by output file name.
+  #   Inputs are named hashes, e.g. of the raw file, of params and of code. An output file is
+  #   current if it has not changed since, and its inputs have the same hashes now.
+  def __init__(self, manifest_file):
+    self.manifest_file = manifest_file
+    self.entries = {}
+    if manifest_file.exists():
+      with open(manifest_file) as json_file:
+        self.entries = json.load(json_file)
+
+  @classmethod
+  def get_hash(cls, text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+  @classmethod
+  def get_file_stat_hash(cls, filepath):
+    # For large files, e.g. raw XML files, which are too slow to read for a hash
+    if not filepath.exists():
+      return cls.get_hash(repr([filepath.name, None]))
+    file_stat = filepath.stat()
+    return cls.get_hash(repr([filepath.name, file_stat.st_size, file_stat.st_mtime_ns]))
+
+  @classmethod
+  def get_file_content_hash(cls, filepath):
+    file_hash = hashlib.sha256()
+    with open(filepath, 'rb') as in_file:
+      while block := in_file.read(cls._file_hash_block_size):
+        file_hash.update(block)
+    return file_hash.hexdigest()
+
+  @classmethod
+  def get_params_hash(cls, params_list, param_values = None):
+    # params may be classes in params.py, or instances such as params.OutputProfile, of which
+    #   all params are hashed. param_values are single params, by name.
+    return cls.get_hash(repr([[sorted((k, repr(v)) for k, v in vars(params).items() \
+                                          if k.isupper()) \
+                                  for params in params_list],
+                              sorted((k, repr(v)) for k, v in (param_values or {}).items())]))
+
+  @classmethod
+  def get_code_hash(cls, script_file):
+    # The script, and all of util
+    source_files = [Path(script_file)] + sorted(cls._util_dir.glob('*.py'))
+    return cls.get_hash(repr([cls.get_file_content_hash(f) for f in source_files]))
+
+  def get_stale_reason(self, out_file, input_hashes):
+    # None if out_file is current
+    entry = self.entries.get(out_file.name)
+    if not entry:
+      return "not built before"
+    if not out_file.exists():
+      return "output file missing"
+    if not entry['output_key'] == data_columns.DataColumns.get_csv_key(out_file):
+      return "output file changed since built"
+
+    changed_inputs = [name for name in sorted(input_hashes.keys() | entry['inputs'].keys()) \
+                          if not entry['inputs'].get(name) == input_hashes.get(name)]
+    if changed_inputs:
+      return "{} changed".format(', '.join(changed_inputs))
+    return None
+
+  def check(self, out_file, input_hashes, force = False):
+    # Shows why out_file must be built, or that it is skipped.
+    stale_reason = "forced" if force else self.get_stale_reason(out_file, input_hashes)
+    if stale_reason:
+      print("BUILD:\t{} ({})".format(out_file.name, stale_reason))
+    else:
+      print("SKIP:\t{} (inputs unchanged)".format(out_file.name))
+    return not stale_reason
+
+  def record(self, out_file, input_hashes):
+    self.entries[out_file.name] = {'inputs': input_hashes,
+                                    'output_key': data_columns.DataColumns.get_csv_key(out_file)}
+
+    with dataio.DataIO.write_replacing(self.manifest_file) as tmp_file, \
+          open(tmp_file, 'w') as json_file:
+      json.dump(self.entries, json_file, indent = 2, sort_keys = True)
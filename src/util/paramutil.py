@@ -9,10 +9,14 @@ class Validator:
       assert not suffix[-1] == '_'
   
   @classmethod
-  def validate_data_params(cls):
-    cls.validate_filename_suffix_format(par.DataParams.FILENAME_SUFFIX)
-    assert par.DataParams.END_DATE > par.DataParams.START_DATE
+  def validate_data_params(cls, data_params = par.DataParams):
+    cls.validate_filename_suffix_format(data_params.FILENAME_SUFFIX)
+    assert data_params.END_DATE > data_params.START_DATE
   
+  @classmethod
+  def validate_data_cache_params(cls):
+    assert 0 <= par.DataCacheParams.MEMORY_CACHE_SIZE
+
   @classmethod
   def validate_graph_dates(cls, graph_start_date, graph_end_date):
     assert graph_start_date >= par.DataParams.START_DATE
@@ -21,24 +25,67 @@ class Validator:
 
 
   @classmethod
-  def validate_parse_data(cls):
+  def validate_parse_data(cls, resume = False):
+    if resume:
+      assert par.ParserParams.CHECKPOINT_PARSE
     if par.ParserParams.WRITE_DATA:
       assert par.ParserParams.PARSE_DATA
+    if not par.ParserParams.XML_BACKEND == par.XmlBackend.ELEMENT_TREE:
+      assert par.ParserParams.STREAM_XML
+    if par.ParserParams.PREFILTER_RECORDS:
+      assert par.ParserParams.STREAM_XML
+      assert not par.ParserParams.SHOW_SUMMARY
+    if par.ParserParams.PIPELINE_PARSE:
+      assert par.ParserParams.STREAM_XML
+      assert 0 < par.ParserParams.PIPELINE_QUEUE_CHUNKS
+    if par.ParserParams.CHECKPOINT_PARSE:
+      assert par.ParserParams.STREAM_XML
+      assert not par.ParserParams.PREFILTER_RECORDS
+      assert not par.ParserParams.PARALLEL_PARSE
+      assert not par.ParserParams.SHOW_SUMMARY
+      assert not par.ParserParams.WRITE_RECORD_CACHE
+      assert not par.ParserParams.READ_RECORD_CACHE
+      assert not par.ParserParams.EXTRA_OUTPUT_PROFILES
+    assert 0 <= par.ParserParams.AGGREGATION_MEMORY_MB
+    if par.ParserParams.AGGREGATION_MEMORY_MB:
+      assert not par.ParserParams.INCREMENTAL_PARSE
+      assert not par.ParserParams.PARALLEL_PARSE
+      assert not par.ParserParams.CHECKPOINT_PARSE
+    if par.ParserParams.PARALLEL_PARSE:
+      assert par.ParserParams.STREAM_XML
+      assert 0 <= par.ParserParams.NUM_PARSE_SHARDS
+    if par.ParserParams.WRITE_RECORD_CACHE:
+      assert par.ParserParams.PARSE_DATA
+    if par.ParserParams.READ_RECORD_CACHE:
+      assert not par.ParserParams.WRITE_RECORD_CACHE
+      assert not par.ParserParams.INCREMENTAL_PARSE
     cls.validate_data_params()
+    cls.validate_data_cache_params()
+    for output_profile in par.ParserParams.EXTRA_OUTPUT_PROFILES:
+      assert par.ParserParams.PARSE_DATA
+      cls.validate_data_params(output_profile)
+
+  @classmethod
+  def validate_benchmark(cls):
+    assert 0 < par.BenchmarkParams.NUM_RECORDS
+    assert 0 < par.BenchmarkParams.NUM_RUNS
 
   @classmethod
   def validate_aggregate_data(cls):
     cls.validate_data_params()
+    cls.validate_data_cache_params()
     assert par.AggregationPeriod.DAILY not in par.AggregatorParams.AGGREGATION_PERIODS
 
   @classmethod
   def validate_build_graphs(cls):
     cls.validate_data_params()
+    cls.validate_data_cache_params()
     cls.validate_graph_dates(par.GraphParams.GRAPH_START_DATE, par.GraphParams.GRAPH_END_DATE)
 
   @classmethod
   def validate_bucketed_graphs(cls):
     cls.validate_data_params()
+    cls.validate_data_cache_params()
     cls.validate_graph_dates(par.BucketedGraphParams.GRAPH_START_DATE,
                               par.BucketedGraphParams.GRAPH_END_DATE)
     
@@ -51,6 +98,7 @@ class Validator:
   @classmethod
   def validate_bucket_tuning(cls):
     cls.validate_data_params()
+    cls.validate_data_cache_params()
 
     assert 0 < par.BucketTuningParams.MIN_BUCKETS < par.BucketTuningParams.MAX_BUCKETS
     assert 0 < par.BucketTuningParams.BUCKET_STEP < \
@@ -60,6 +108,7 @@ class Validator:
   @classmethod
   def validate_record_comparison(cls):
     cls.validate_data_params()
+    cls.validate_data_cache_params()
 
     assert par.AggregationPeriod.MONTHLY not in par.RecordComparisonParams.AGGREGATION_PERIODS
     assert par.AggregationPeriod.QUARTERLY not in par.RecordComparisonParams.AGGREGATION_PERIODS
@@ -77,6 +126,7 @@ class Validator:
   @classmethod
   def validate_distribution_fit(cls):
     cls.validate_data_params()
+    cls.validate_data_cache_params()
 
     assert par.AggregationPeriod.QUARTERLY not in par.DistributionFitParams.AGGREGATION_PERIODS
     assert 0 < par.DistributionFitParams.NUM_BEST_FITS
@@ -84,6 +134,7 @@ class Validator:
   @classmethod
   def validate_run_clustering(cls):
     cls.validate_data_params()
+    cls.validate_data_cache_params()
 
     assert par.AggregationPeriod.MONTHLY not in par.ClusteringParams.AGGREGATION_PERIODS
     assert par.AggregationPeriod.QUARTERLY not in par.ClusteringParams.AGGREGATION_PERIODS
@@ -91,6 +142,7 @@ class Validator:
   @classmethod
   def validate_moving_average(cls):
     cls.validate_data_params()
+    cls.validate_data_cache_params()
 
     assert 0 < par.MovingAverageParams.MIN_WEEKS < par.MovingAverageParams.MAX_WEEKS
     assert 0 < len(par.MovingAverageParams.ACTIVITIES)
@@ -0,0 +1,236 @@
+from datetime import date
+import numpy as np
+
+import params as par
+from . import dataio, xml_parse
+
+class RecordWatermarks:
+
+  # previous maps each record type to the (endDate, creationDate) epoch seconds of the latest
+  #   records seen by the last parse. Records at or before both watermarks were already parsed.
+  def __init__(self, previous = None):
+    self.previous = previous or {}
+    self.latest = dict(self.previous)
+
+  def check_and_update(self, r, end_epoch, creation_epoch):
+    previous_end, previous_creation = self.previous.get(r, (None, None))
+    is_new = previous_end is None \
+                or end_epoch > previous_end or creation_epoch > previous_creation
+
+    latest_end, latest_creation = self.latest.get(r, (end_epoch, creation_epoch))
+    self.latest[r] = tuple([max(latest_end, end_epoch), max(latest_creation, creation_epoch)])
+
+    return is_new
+
+  def merge(self, other):
+    for r, (end_epoch, creation_epoch) in other.latest.items():
+      latest_end, latest_creation = self.latest.get(r, (end_epoch, creation_epoch))
+      self.latest[r] = tuple([max(latest_end, end_epoch), max(latest_creation, creation_epoch)])
+
+
+class ParseState:
+
+  _record_types = par.RecordParams.RECORD_TYPES
+
+  def __init__(self, params_key, watermarks = None):
+    self.params_key = params_key
+    self.watermarks = watermarks or {}
+
+    # Hourly [sum, count] and daily aggregates, by record type and date
+    self.hourly_sums = {rt.record: {} for rt in self._record_types}
+    self.daily_values = {rt.record: {} for rt in self._record_types}
+
+  @classmethod
+  def get_params_key(cls, start_date, end_date, parse_timezone):
+    # Any change to these params invalidates a saved state.
+    return repr([start_date, end_date, parse_timezone,
+                  sorted(r.name for r in par.ParserParams.SKIP_IPHONE_RECORDS),
+                  [tuple([rt.record.name, rt.unit, rt.aggregation.name]) \
+                      for rt in cls._record_types]])
+
+  def add_records(self, records_by_date):
+    touched_days = {r: set() for r in records_by_date}
+    for r in records_by_date:
+      for d in records_by_date[r]:
+        if d not in self.hourly_sums[r]:
+          self.hourly_sums[r][d] = {}
+        for hr, (hour_sum, hour_count) in records_by_date[r][d].items():
+          xml_parse.XmlParse.add_to_hour(self.hourly_sums[r][d], hr, hour_sum, hour_count)
+        touched_days[r].add(d)
+
+    return touched_days
+
+  def aggregate_days(self, touched_days):
+    records_to_agg_type = {rt.record: rt.aggregation for rt in self._record_types}
+
+    hourly_values = {r: {} for r in touched_days}
+    for r in touched_days:
+      for d in touched_days[r]:
+        hourly_values[r][d] = dict(self.hourly_sums[r][d])
+    xml_parse.XmlParse.aggregate_by_hour(hourly_values, records_to_agg_type)
+
+    daily_values = xml_parse.XmlParse.aggregate_by_day(hourly_values, records_to_agg_type)
+    for r in daily_values:
+      self.daily_values[r].update(daily_values[r])
+
+  def get_records_by_date(self):
+    return {r: dict(self.daily_values[r]) for r in self.daily_values}
+
+  @classmethod
+  def to_stored_value(cls, v):
+    return float(v), isinstance(v, (int, np.integer))
+
+  @classmethod
+  def from_stored_value(cls, v, is_int):
+    # Aggregates are NumPy scalars when parsed, and must stay so to be rounded the same way.
+    return np.int64(v) if is_int else np.float64(v)
+
+  def get_arrays(self):
+    hourly_rows = []
+    for r in self.hourly_sums:
+      for d in self.hourly_sums[r]:
+        for hr, (hour_sum, hour_count) in self.hourly_sums[r][d].items():
+          hourly_rows.append(tuple([r.value, d.toordinal(), hr,
+                                    *self.to_stored_value(hour_sum), hour_count]))
+    daily_rows = []
+    for r in self.daily_values:
+      for d, v in self.daily_values[r].items():
+        daily_rows.append(tuple([r.value, d.toordinal(), *self.to_stored_value(v)]))
+    watermark_rows = [tuple([r.value, end_epoch, creation_epoch]) \
+                          for r, (end_epoch, creation_epoch) in self.watermarks.items()]
+
+    hourly_columns = list(zip(*hourly_rows)) or [[]] * 6
+    daily_columns = list(zip(*daily_rows)) or [[]] * 4
+    watermark_columns = list(zip(*watermark_rows)) or [[]] * 3
+
+    return dict(
+        params_key = np.array(self.params_key),
+        hourly_records = np.array(hourly_columns[0], dtype = np.int16),
+        hourly_days = np.array(hourly_columns[1], dtype = np.int32),
+        hourly_hours = np.array(hourly_columns[2], dtype = np.int8),
+        hourly_sums = np.array(hourly_columns[3], dtype = np.float64),
+        hourly_is_int = np.array(hourly_columns[4], dtype = bool),
+        hourly_counts = np.array(hourly_columns[5], dtype = np.int64),
+        daily_records = np.array(daily_columns[0], dtype = np.int16),
+        daily_days = np.array(daily_columns[1], dtype = np.int32),
+        daily_values = np.array(daily_columns[2], dtype = np.float64),
+        daily_is_int = np.array(daily_columns[3], dtype = bool),
+        watermark_records = np.array(watermark_columns[0], dtype = np.int16),
+        watermark_ends = np.array(watermark_columns[1], dtype = np.int64),
+        watermark_creations = np.array(watermark_columns[2], dtype = np.int64))
+
+  def save(self, out_file):
+    with dataio.DataIO.write_replacing(out_file) as tmp_file, open(tmp_file, 'wb') as f:
+      np.savez_compressed(f, **self.get_arrays())
+
+  @classmethod
+  def load(cls, in_file, params_key):
+    if not in_file.exists():
+      return None
+
+    with np.load(in_file) as state_data:
+      if not str(state_data['params_key']) == params_key:
+        return None
+      return cls.from_arrays(state_data, params_key)
+
+  @classmethod
+  def from_arrays(cls, state_data, params_key):
+    watermarks = {}
+    for r, end_epoch, creation_epoch in zip(state_data['watermark_records'].tolist(),
+                                            state_data['watermark_ends'].tolist(),
+                                            state_data['watermark_creations'].tolist()):
+      watermarks[par.Activity(r)] = tuple([end_epoch, creation_epoch])
+    parse_state = cls(params_key, watermarks)
+
+    dates_by_ordinal = {}
+    for r, d, hr, hour_sum, is_int, hour_count in zip(state_data['hourly_records'].tolist(),
+                                                      state_data['hourly_days'].tolist(),
+                                                      state_data['hourly_hours'].tolist(),
+                                                      state_data['hourly_sums'].tolist(),
+                                                      state_data['hourly_is_int'].tolist(),
+                                                      state_data['hourly_counts'].tolist()):
+      if d not in dates_by_ordinal:
+        dates_by_ordinal[d] = date.fromordinal(d)
+      hourly_sums = parse_state.hourly_sums[par.Activity(r)]
+      if dates_by_ordinal[d] not in hourly_sums:
+        hourly_sums[dates_by_ordinal[d]] = {}
+      hourly_sums[dates_by_ordinal[d]][hr] = \
+          [cls.from_stored_value(hour_sum, is_int), hour_count]
+
+    for r, d, v, is_int in zip(state_data['daily_records'].tolist(),
+                                state_data['daily_days'].tolist(),
+                                state_data['daily_values'].tolist(),
+                                state_data['daily_is_int'].tolist()):
+      if d not in dates_by_ordinal:
+        dates_by_ordinal[d] = date.fromordinal(d)
+      parse_state.daily_values[par.Activity(r)][dates_by_ordinal[d]] = \
+          cls.from_stored_value(v, is_int)
+
+    return parse_state
+
+
+class ParseCheckpoint(ParseState):
+
+  # Hourly [sum, count] of the records parsed so far, and where they end in the XML file, so that
+  #   an interrupted parse can continue from there. Watermarks are the latest ones so far.
+  def __init__(self, params_key, watermarks = None):
+    super().__init__(params_key, watermarks)
+    self.parse_stats = xml_parse.ParseStats()
+    self.records_offset = 0
+    self.num_records = 0
+    self.out_file = None
+
+  @classmethod
+  def get_params_key(cls, in_xml, start_date, end_date, parse_timezone, incremental_parse):
+    # A checkpoint is only valid for the same XML file.
+    in_xml_stat = in_xml.stat()
+    return repr([ParseState.get_params_key(start_date, end_date, parse_timezone),
+                  in_xml.name, in_xml_stat.st_size, in_xml_stat.st_mtime_ns, incremental_parse])
+
+  def get_arrays(self):
+    parse_stats = self.parse_stats
+    return super().get_arrays() | dict(
+        records_offset = np.array(self.records_offset, dtype = np.int64),
+        num_records = np.array(self.num_records, dtype = np.int64),
+        matched_types = np.array(list(parse_stats.matched_records.keys()), dtype = str),
+        matched_counts = np.array(list(parse_stats.matched_records.values()), dtype = np.int64),
+        unmatched_types = np.array(list(parse_stats.unmatched_records.keys()), dtype = str),
+        unmatched_counts = np.array(list(parse_stats.unmatched_records.values()),
+                                    dtype = np.int64),
+        malformed_records = np.array([r.value for r in parse_stats.malformed_values.keys()],
+                                      dtype = np.int16),
+        malformed_counts = np.array(list(parse_stats.malformed_values.values()),
+                                    dtype = np.int64),
+        already_parsed_records = np.array(parse_stats.already_parsed_records, dtype = np.int64))
+
+  @classmethod
+  def from_arrays(cls, state_data, params_key):
+    parse_checkpoint = super().from_arrays(state_data, params_key)
+    parse_checkpoint.records_offset = int(state_data['records_offset'])
+    parse_checkpoint.num_records = int(state_data['num_records'])
+
+    parse_stats = parse_checkpoint.parse_stats
+    parse_stats.matched_records = dict(zip(state_data['matched_types'].tolist(),
+                                            state_data['matched_counts'].tolist()))
+    parse_stats.unmatched_records = dict(zip(state_data['unmatched_types'].tolist(),
+                                              state_data['unmatched_counts'].tolist()))
+    parse_stats.malformed_values = {par.Activity(r): count \
+                                      for r, count in zip(state_data['malformed_records'].tolist(),
+                                                          state_data['malformed_counts'].tolist())}
+    parse_stats.already_parsed_records = int(state_data['already_parsed_records'])
+    return parse_checkpoint
+
+  @classmethod
+  def load(cls, in_file, params_key):
+    parse_checkpoint = super().load(in_file, params_key)
+    if parse_checkpoint:
+      parse_checkpoint.out_file = in_file
+    return parse_checkpoint
+
+  def save_at(self, records_offset, num_records, record_watermarks = None):
+    # hourly_sums and parse_stats are updated by the parse itself.
+    self.records_offset = records_offset
+    self.num_records = num_records
+    if record_watermarks:
+      self.watermarks = dict(record_watermarks.latest)
+    self.save(self.out_file)
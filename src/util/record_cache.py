@@ -0,0 +1,124 @@
+from array import array
+import json
+import numpy as np
+
+import params as par
+from . import aggregation, dataio, timeutil, valueutil, xml_parse
+
+class RecordColumns:
+
+  # Column name -> array typecode
+  _columns = {'records': 'b',
+              'sources': 'i',
+              'start_epochs': 'q',
+              'end_epochs': 'q',
+              'end_utc_offsets': 'i',
+              'values': 'd',
+              'value_is_int': 'b'}
+  _source_names_file = 'source_names.json'
+
+  def __init__(self):
+    self.columns = {c: array(tc) for c, tc in self._columns.items()}
+    self.source_codes = {}
+
+  def get_source_code(self, source_name):
+    source_code = self.source_codes.get(source_name)
+    if source_code is None:
+      source_code = len(self.source_codes)
+      self.source_codes[source_name] = source_code
+    return source_code
+
+  def append_xml_record(self, r, attrib):
+    v = valueutil.ValueDecoder.try_decode(attrib['value'])
+    if v is None:
+      return
+    start_epoch, _ = timeutil.DatetimeUtil.parse_xml_timestamp(attrib['startDate'])
+    end_epoch, end_utc_offset = timeutil.DatetimeUtil.parse_xml_timestamp(attrib['endDate'])
+
+    self.columns['records'].append(r.value)
+    self.columns['sources'].append(self.get_source_code(attrib['sourceName']))
+    self.columns['start_epochs'].append(start_epoch)
+    self.columns['end_epochs'].append(end_epoch)
+    self.columns['end_utc_offsets'].append(end_utc_offset)
+    self.columns['values'].append(v)
+    self.columns['value_is_int'].append(isinstance(v, int))
+
+  def merge(self, other):
+    # other's records are appended after these, with its source codes mapped to these.
+    source_code_map = array('i', [0] * len(other.source_codes))
+    for source_name, source_code in other.source_codes.items():
+      source_code_map[source_code] = self.get_source_code(source_name)
+
+    for c in self._columns:
+      if c == 'sources':
+        self.columns[c].extend(source_code_map[sc] for sc in other.columns[c])
+      else:
+        self.columns[c].extend(other.columns[c])
+
+  def __len__(self):
+    return len(self.columns['records'])
+
+  def get_arrays(self):
+    # Same as util.record_cache.RecordCache.load_columns
+    columns = {c: np.frombuffer(column, dtype = column.typecode) \
+                  for c, column in self.columns.items()}
+    source_names = sorted(self.source_codes, key = self.source_codes.get)
+    return columns, source_names
+
+  def save(self, cache_dir):
+    columns, source_names = self.get_arrays()
+    with dataio.DataIO.write_replacing(cache_dir, is_dir = True) as tmp_dir:
+      for c, column in columns.items():
+        np.save(tmp_dir / (c + '.npy'), column)
+      with open(tmp_dir / self._source_names_file, 'w') as source_names_file:
+        json.dump(source_names, source_names_file)
+
+
+class RecordCache:
+
+  _record_types = par.RecordParams.RECORD_TYPES
+
+  @classmethod
+  def load_columns(cls, cache_dir):
+    columns = {c: np.load(cache_dir / (c + '.npy'), mmap_mode = 'r') \
+                  for c in RecordColumns._columns}
+    with open(cache_dir / RecordColumns._source_names_file) as source_names_file:
+      source_names = json.load(source_names_file)
+    return columns, source_names
+
+  @classmethod
+  def get_local_days_hours(cls, columns, parse_timezone):
+    # With CURRENT_TIMEZONE, the UTC offsets of the timestamps are used.
+    utc_offsets = None if parse_timezone == par.ParseTimezone.DATA_TIMEZONE \
+                      else columns['end_utc_offsets']
+    return timeutil.TimezoneUtil.get_local_days_hours(columns['end_epochs'], utc_offsets)
+
+  @classmethod
+  def get_kept_records(cls, columns, source_names, start_date, end_date, parse_timezone):
+    day_ordinals, hours, valid = cls.get_local_days_hours(columns, parse_timezone)
+    in_range = valid \
+                  & (day_ordinals >= start_date.toordinal()) \
+                  & (day_ordinals < end_date.toordinal())
+
+    iphone_sources = np.array([xml_parse.XmlParse._iphone_source_text in sn \
+                                  for sn in source_names], dtype = bool)
+    skip_iphone_record_codes = [r.value for r in par.ParserParams.SKIP_IPHONE_RECORDS]
+    skipped = np.isin(columns['records'], skip_iphone_record_codes) \
+                & iphone_sources[columns['sources']]
+
+    configured = np.isin(columns['records'], [rt.record.value for rt in cls._record_types])
+
+    return configured & in_range & ~skipped, day_ordinals, hours
+
+  @classmethod
+  def aggregate_records(cls, columns, source_names, start_date, end_date, parse_timezone):
+    kept, day_ordinals, hours = cls.get_kept_records(columns, source_names,
+                                                      start_date, end_date, parse_timezone)
+    kept_indices = np.flatnonzero(kept)
+
+    return aggregation.ColumnAggregation.aggregate_columns(
+                columns['records'][kept_indices],
+                day_ordinals[kept_indices],
+                hours[kept_indices],
+                columns['values'][kept_indices],
+                columns['value_is_int'][kept_indices])
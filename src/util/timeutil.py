@@ -1,6 +1,8 @@
+from bisect import bisect_right
 from dataclasses import dataclass
-from datetime import date, datetime, timedelta, timezone
+from datetime import date, datetime, time, timedelta, timezone
 from dateutil import relativedelta as rd
+import numpy as np
 
 import params as par
 
@@ -60,33 +62,193 @@ class TimezoneHistory:
     last_end_date = tzh.end_date
   print("VALIDATED TIMEZONE HISTORY")
 
+  # The history compiled into UTC instants. A time belongs to the first period whose end date has
+  #   not passed in that period's timezone, i.e. the first period whose end time is later.
+  #   End times are kept sorted with a running max so that they can be searched by bisection.
+  _utc_start_time = int(datetime.combine(_first_date, time(), _tz_history[0].tz).timestamp())
+  _utc_end_times = []
+  _utc_offsets = []
+  for tzh in _tz_history:
+    utc_end_time = int(datetime.combine(tzh.end_date + timedelta(days = 1), time(), tzh.tz)
+                          .timestamp())
+    if _utc_end_times:
+      utc_end_time = max(utc_end_time, _utc_end_times[-1])
+    _utc_end_times.append(utc_end_time)
+    _utc_offsets.append(int(tzh.tz.utcoffset(None).total_seconds()))
+  _max_utc_offset = max(abs(o) for o in _utc_offsets)
+
+  _utc_end_times_array = np.array(_utc_end_times, dtype = np.int64)
+  _utc_offsets_array = np.array(_utc_offsets, dtype = np.int64)
+
 class TimezoneUtil:
 
+  @classmethod
+  def get_period_index(cls, epoch_seconds):
+    if epoch_seconds < TimezoneHistory._utc_start_time:
+      return None
+    i = bisect_right(TimezoneHistory._utc_end_times, epoch_seconds)
+    if i == len(TimezoneHistory._utc_end_times):
+      return None
+    return i
+
+  @classmethod
+  def get_utc_offset(cls, epoch_seconds):
+    i = cls.get_period_index(epoch_seconds)
+    if i is None:
+      return None
+    return TimezoneHistory._utc_offsets[i]
+
   @classmethod
   def adjust_datetime_timezone(cls, dt):
-    for tzh in TimezoneHistory._tz_history:
-      adjusted_dt = dt.astimezone(tzh.tz)
-      adjusted_date = adjusted_dt.date()
-      if adjusted_date < TimezoneHistory._first_date:
-        return None
-      if adjusted_date <= tzh.end_date:
-        return adjusted_dt
-    
-    return None
+    i = cls.get_period_index(dt.timestamp())
+    if i is None:
+      return None
+    return dt.astimezone(TimezoneHistory._tz_history[i].tz)
+
+  @classmethod
+  def get_local_days_hours(cls, epoch_seconds, utc_offsets = None):
+    # Vectorized lookup for an array of UTC epoch seconds. Returns arrays of local date ordinals
+    #   and local hours, and a mask of times that fall within the timezone history.
+    #   utc_offsets, if set (e.g. those of the timestamps), are used instead of the history.
+    epoch_seconds = np.asarray(epoch_seconds, dtype = np.int64)
+    if utc_offsets is None:
+      period_indices = np.searchsorted(TimezoneHistory._utc_end_times_array, epoch_seconds,
+                                        side = 'right')
+      num_periods = len(TimezoneHistory._utc_end_times_array)
+      valid = (epoch_seconds >= TimezoneHistory._utc_start_time) \
+                & (period_indices < num_periods)
+      utc_offsets = TimezoneHistory._utc_offsets_array[np.minimum(period_indices,
+                                                                  num_periods - 1)]
+    else:
+      valid = np.ones(len(epoch_seconds), dtype = bool)
+
+    day_ordinals, hours = DatetimeUtil.get_local_day_hour(epoch_seconds, utc_offsets)
+    return day_ordinals, hours, valid
 
 class DatetimeUtil:
 
   _datetime_formal_xml = '%Y-%m-%d %H:%M:%S %z'
+  # Apple Health timestamps are fixed-width: 'YYYY-MM-DD HH:MM:SS +ZZZZ'
+  _datetime_length_xml = 25
+  # UTC offsets range from -12:00 to +14:00
+  _max_utc_offset_xml = 14 * 60 * 60
+
+  _epoch_ordinal = date(1970, 1, 1).toordinal()
+  _seconds_per_day = 24 * 60 * 60
+
+  # Caches keyed by the date and UTC offset parts of XML timestamps
+  _xml_date_ordinals = {}
+  _xml_utc_offsets = {}
+  _xml_timezones = {}
+
+  @classmethod
+  def get_xml_date_ordinal(cls, date_string_from_xml):
+    day_ordinal = cls._xml_date_ordinals.get(date_string_from_xml)
+    if day_ordinal is None:
+      day_ordinal = date(int(date_string_from_xml[0 : 4]),
+                          int(date_string_from_xml[5 : 7]),
+                          int(date_string_from_xml[8 : 10])).toordinal()
+      cls._xml_date_ordinals[date_string_from_xml] = day_ordinal
+    return day_ordinal
+
+  @classmethod
+  def get_xml_utc_offset(cls, offset_string_from_xml):
+    utc_offset = cls._xml_utc_offsets.get(offset_string_from_xml)
+    if utc_offset is None:
+      assert offset_string_from_xml[0] in '+-'
+      utc_offset = int(offset_string_from_xml[1 : 3]) * 3600 \
+                      + int(offset_string_from_xml[3 : 5]) * 60
+      if offset_string_from_xml[0] == '-':
+        utc_offset = -utc_offset
+      cls._xml_utc_offsets[offset_string_from_xml] = utc_offset
+    return utc_offset
+
+  @classmethod
+  def get_xml_timezone(cls, offset_string_from_xml):
+    tz = cls._xml_timezones.get(offset_string_from_xml)
+    if tz is None:
+      tz = timezone(timedelta(seconds = cls.get_xml_utc_offset(offset_string_from_xml)))
+      cls._xml_timezones[offset_string_from_xml] = tz
+    return tz
+
+  @classmethod
+  def decode_xml_datetime(cls, datetime_string_from_xml):
+    s = datetime_string_from_xml
+    if not len(s) == cls._datetime_length_xml:
+      return datetime.strptime(s, cls._datetime_formal_xml)
+
+    return datetime(int(s[0 : 4]), int(s[5 : 7]), int(s[8 : 10]),
+                    int(s[11 : 13]), int(s[14 : 16]), int(s[17 : 19]),
+                    tzinfo = cls.get_xml_timezone(s[20 : ]))
+
+  @classmethod
+  def parse_xml_timestamp(cls, datetime_string_from_xml):
+    # Returns a tuple of (UTC epoch seconds, UTC offset seconds) without building a datetime.
+    s = datetime_string_from_xml
+    if not len(s) == cls._datetime_length_xml:
+      dt_parsed = datetime.strptime(s, cls._datetime_formal_xml)
+      return int(dt_parsed.timestamp()), int(dt_parsed.utcoffset().total_seconds())
+
+    utc_offset = cls.get_xml_utc_offset(s[20 : ])
+    epoch_days = cls.get_xml_date_ordinal(s[ : 10]) - cls._epoch_ordinal
+    epoch_seconds = epoch_days * cls._seconds_per_day \
+                      + int(s[11 : 13]) * 3600 + int(s[14 : 16]) * 60 + int(s[17 : 19]) \
+                      - utc_offset
+    return epoch_seconds, utc_offset
+
+  @classmethod
+  def parse_xml_day_hour(cls, datetime_string_from_xml, parse_timezone):
+    # Returns a tuple of (local date ordinal, local hour), or None if the timezone is unknown.
+    s = datetime_string_from_xml
+    if parse_timezone == par.ParseTimezone.CURRENT_TIMEZONE \
+        and len(s) == cls._datetime_length_xml:
+      return cls.get_xml_date_ordinal(s[ : 10]), int(s[11 : 13])
+
+    epoch_seconds, utc_offset = cls.parse_xml_timestamp(s)
+    if parse_timezone == par.ParseTimezone.DATA_TIMEZONE:
+      utc_offset = TimezoneUtil.get_utc_offset(epoch_seconds)
+      if utc_offset is None:
+        return None
+    return cls.get_local_day_hour(epoch_seconds, utc_offset)
+
+  @classmethod
+  def get_local_day_hour(cls, epoch_seconds, utc_offset):
+    # Also works on arrays (see TimezoneUtil.get_local_days_hours)
+    local_seconds = epoch_seconds + utc_offset
+    return local_seconds // cls._seconds_per_day + cls._epoch_ordinal, \
+              local_seconds % cls._seconds_per_day // 3600
 
   @classmethod
   def parse_xml_datetime(cls, datetime_string_from_xml, parse_timezone):
-    dt_parsed = datetime.strptime(datetime_string_from_xml, cls._datetime_formal_xml)
+    dt_parsed = cls.decode_xml_datetime(datetime_string_from_xml)
     
     if parse_timezone == par.ParseTimezone.DATA_TIMEZONE:
       return TimezoneUtil.adjust_datetime_timezone(dt_parsed)
     elif parse_timezone == par.ParseTimezone.CURRENT_TIMEZONE:
       return dt_parsed
 
+  @classmethod
+  def get_xml_date_range(cls, start_date, end_date, parse_timezone):
+    # Bounds for comparing XML timestamps as strings, before they are parsed. With DATA_TIMEZONE,
+    #   the local date can be off the date in the timestamp by both UTC offsets.
+    margin_days = 0
+    if parse_timezone == par.ParseTimezone.DATA_TIMEZONE:
+      margin_seconds = TimezoneHistory._max_utc_offset + cls._max_utc_offset_xml
+      margin_days = -(-margin_seconds // cls._seconds_per_day)
+    return (start_date - timedelta(days = margin_days)).isoformat(), \
+              (end_date + timedelta(days = margin_days)).isoformat()
+
+  @classmethod
+  def check_xml_date_range(cls, datetime_string_from_xml, start_string, end_string):
+    # 'YYYY-MM-DD' bounds compare with fixed-width timestamps in date order. Other timestamps
+    #   are let through, to be parsed and checked as usual.
+    s = datetime_string_from_xml
+    return not len(s) == cls._datetime_length_xml or start_string <= s < end_string
+
+  @classmethod
+  def check_day_ordinal_range(cls, day_ordinal, start_ordinal, end_ordinal):
+    return start_ordinal <= day_ordinal < end_ordinal
+
   @classmethod
   def check_date_range(cls, d, start_date = None, end_date = None):
     if not d:
@@ -0,0 +1,23 @@
+import math
+
+class ValueDecoder:
+
+  # Values are decoded as eval() would have done: whole numbers as ints (so that daily sums of
+  #   whole numbers are still written as ints), and others as floats. Values that are not finite
+  #   (nan, inf), which eval() rejected, are malformed.
+  @classmethod
+  def decode_number(cls, value_string):
+    try:
+      return int(value_string)
+    except ValueError:
+      v = float(value_string)
+      if not math.isfinite(v):
+        raise ValueError("Not a finite number: {}".format(value_string))
+      return v
+
+  @classmethod
+  def try_decode(cls, value_string):
+    try:
+      return cls.decode_number(value_string)
+    except ValueError:
+      return None
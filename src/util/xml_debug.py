@@ -1,5 +1,5 @@
 import params as par
-from . import timeutil
+from . import timeutil, xml_stream
 
 class XmlDebug:
   
@@ -15,12 +15,14 @@ class XmlDebug:
   _show_record_source_counts = par.XmlDebugParams.SHOW_RECORD_SOURCE_COUNTS
 
   @classmethod
-  def show_node_summary(cls, node):
+  def show_node_summary(cls, node, show_children = True):
     print("{}".format(node.tag))
     print("\t{} attribute(s)".format(len(node.attrib)))
     for a, v in node.attrib.items():
       print("\t\t{}:\t{}".format(a, v))
     
+    if not show_children:
+      return
     print("\t{} children".format(len(node)))
     for i, child in enumerate(node):
       print("\t\t{}:\t{}".format(i, child.tag))
@@ -29,137 +31,174 @@ class XmlDebug:
         break
   
   @classmethod
-  def show_tree_summary(cls, tree, start_date, end_date, parse_timezone):
-    root = tree.getroot()
+  def show_tree_summary(cls, xml_data, start_date, end_date, parse_timezone):
+    tree_summary = TreeSummary(start_date, end_date, parse_timezone)
+    for attrib in xml_stream.XmlRecords.iter_records(xml_data):
+      tree_summary.add_record(attrib)
+    tree_summary.show(xml_data)
 
-    print()
-    print("TREE SUMMARY")
-    cls.show_node_summary(root)
+
+class TreeSummary:
+
+  # Counters are collected one record at a time, so that they can also be collected during a
+  #   parse (see util.xml_parse.XmlParse.collect_xml_records) instead of in a separate pass.
+  def __init__(self, start_date, end_date, parse_timezone):
+    self.parse_timezone = parse_timezone
+    self.start_ordinal = start_date.toordinal()
+    self.end_ordinal = end_date.toordinal()
+
+    self.type_unit_counts = {}
+    self.type_source_counts = {}
+    self.orphan_date_records = {}
+    self.record_metrics = {'total_records' : 0,
+                            'missing_type' : 0,
+                            'missing_start_date' : 0,
+                            'missing_end_date' : 0,
+                            'orphan_start_date': 0,
+                            'orphan_end_date': 0,
+                            'outside_date_range': 0,
+                            'missing_source': 0,
+                            'missing_unit' : 0,
+                            'missing_value' : 0}
+    self.missing_unit_record_types = set()
+    self.skipped_record_types = set()
+
+  def add_orphan_date(self, attrib):
+    t = attrib['type']
+    if t not in self.orphan_date_records:
+      self.orphan_date_records[t] = set()
+    date_string = attrib['startDate'][:10]
+    self.orphan_date_records[t].add(date_string)
+
+  # Returns the (day ordinal, hour) of the record's endDate, or None if it has none.
+  def add_record(self, attrib):
+    record_metrics = self.record_metrics
+    record_metrics['total_records'] += 1
     
-    type_unit_counts = {}
-    type_source_counts = {}
-    orphan_date_records = {}
-    record_metrics = {'total_records' : 0,
-                      'missing_type' : 0,
-                      'missing_start_date' : 0,
-                      'missing_end_date' : 0,
-                      'orphan_start_date': 0,
-                      'orphan_end_date': 0,
-                      'outside_date_range': 0,
-                      'missing_source': 0,
-                      'missing_unit' : 0,
-                      'missing_value' : 0}
-    missing_unit_record_types = set()
-    skipped_record_types = set()
+    skip_record = False
+    if 'type' not in attrib:
+      record_metrics['missing_type'] += 1
+      skip_record = True
+    if 'sourceName' not in attrib:
+      record_metrics['missing_source'] += 1
+      skip_record = True
+    if 'unit' not in attrib:
+      record_metrics['missing_unit'] += 1
+      self.missing_unit_record_types.add(attrib['type'])
+      skip_record = True
+    if 'value' not in attrib:
+      record_metrics['missing_value'] += 1
+      skip_record = True
     
-    for child in root:
-      if not child.tag == 'Record':
-        continue
-      record_metrics['total_records'] += 1
-      
-      skip_record = False
-      if 'type' not in child.attrib:
-        record_metrics['missing_type'] += 1
-        skip_record = True
-      if 'sourceName' not in child.attrib:
-        record_metrics['missing_source'] += 1
-        skip_record = True
-      if 'unit' not in child.attrib:
-        record_metrics['missing_unit'] += 1
-        missing_unit_record_types.add(child.attrib['type'])
+    end_day_hour = None
+    if 'endDate' in attrib:
+      end_day_hour = \
+          timeutil.DatetimeUtil.parse_xml_day_hour(attrib['endDate'], self.parse_timezone)
+
+    if 'startDate' not in attrib:
+      record_metrics['missing_start_date'] += 1
+      skip_record = True
+    elif 'endDate' not in attrib:
+      record_metrics['missing_end_date'] += 1
+      skip_record = True
+    else:
+      start_day_hour = \
+          timeutil.DatetimeUtil.parse_xml_day_hour(attrib['startDate'], self.parse_timezone)
+
+      if not start_day_hour:
+        record_metrics['orphan_start_date'] += 1
+        self.add_orphan_date(attrib)
         skip_record = True
-      if 'value' not in child.attrib:
-        record_metrics['missing_value'] += 1
+      if not end_day_hour:
+        record_metrics['orphan_end_date'] += 1
+        self.add_orphan_date(attrib)
         skip_record = True
       
-      if 'startDate' not in child.attrib:
-        record_metrics['missing_start_date'] += 1
-        skip_record = True
-      elif 'endDate' not in child.attrib:
-        record_metrics['missing_end_date'] += 1
-        skip_record = True
-      else:
-        start_dt_parsed = \
-            timeutil.DatetimeUtil.parse_xml_datetime(child.attrib['startDate'], parse_timezone)
-        end_dt_parsed = \
-            timeutil.DatetimeUtil.parse_xml_datetime(child.attrib['endDate'], parse_timezone)
-
-        if not start_dt_parsed:
-          record_metrics['orphan_start_date'] += 1
-          t = child.attrib['type']
-          if t not in orphan_date_records:
-            orphan_date_records[t] = set()
-          date_string = child.attrib['startDate'][:10]
-          orphan_date_records[t].add(date_string)
-          skip_record = True
-        if not end_dt_parsed:
-          record_metrics['orphan_end_date'] += 1
-          t = child.attrib['type']
-          if t not in orphan_date_records:
-            orphan_date_records[t] = set()
-          date_string = child.attrib['startDate'][:10]
-          orphan_date_records[t].add(date_string)
+      if start_day_hour and end_day_hour:
+        start_time_in_range = timeutil.DatetimeUtil.check_day_ordinal_range(
+                                  start_day_hour[0], self.start_ordinal, self.end_ordinal)
+        end_time_in_range = timeutil.DatetimeUtil.check_day_ordinal_range(
+                                  end_day_hour[0], self.start_ordinal, self.end_ordinal)
+        if not start_time_in_range or not end_time_in_range:
+          record_metrics['outside_date_range'] += 1
           skip_record = True
-        
-        if start_dt_parsed and end_dt_parsed:
-          start_time_in_range = \
-              timeutil.DatetimeUtil.check_datetime_range(start_dt_parsed, start_date, end_date)
-          end_time_in_range = \
-              timeutil.DatetimeUtil.check_datetime_range(end_dt_parsed, start_date, end_date)
-          if not start_time_in_range or not end_time_in_range:
-            record_metrics['outside_date_range'] += 1
-            skip_record = True
-      
-      if not skip_record:
-        t = child.attrib['type']
-        if cls._skip_dietary_data and t.startswith('HKQuantityTypeIdentifierDietary'):
-          skipped_record_types.add(t)
-          continue
-        
-        u = child.attrib['unit']
-        tu_tuple = tuple([t, u])
-        if not tu_tuple in type_unit_counts:
-          type_unit_counts[tu_tuple] = 0
-        type_unit_counts[tu_tuple] += 1
-
-        s = child.attrib['sourceName']
-        ts_tuple = tuple([t, s])
-        if not ts_tuple in type_source_counts:
-          type_source_counts[ts_tuple] = 0
-        type_source_counts[ts_tuple] += 1
     
+    if not skip_record:
+      t = attrib['type']
+      if XmlDebug._skip_dietary_data and t.startswith('HKQuantityTypeIdentifierDietary'):
+        self.skipped_record_types.add(t)
+        return end_day_hour
+      
+      u = attrib['unit']
+      tu_tuple = tuple([t, u])
+      if not tu_tuple in self.type_unit_counts:
+        self.type_unit_counts[tu_tuple] = 0
+      self.type_unit_counts[tu_tuple] += 1
+
+      s = attrib['sourceName']
+      ts_tuple = tuple([t, s])
+      if not ts_tuple in self.type_source_counts:
+        self.type_source_counts[ts_tuple] = 0
+      self.type_source_counts[ts_tuple] += 1
+
+    return end_day_hour
+
+  def merge(self, other):
+    for counts, other_counts in [(self.type_unit_counts, other.type_unit_counts),
+                                  (self.type_source_counts, other.type_source_counts),
+                                  (self.record_metrics, other.record_metrics)]:
+      for k, count in other_counts.items():
+        counts[k] = counts.get(k, 0) + count
+    for t, date_strings in other.orphan_date_records.items():
+      if t not in self.orphan_date_records:
+        self.orphan_date_records[t] = set()
+      self.orphan_date_records[t] |= date_strings
+    self.missing_unit_record_types |= other.missing_unit_record_types
+    self.skipped_record_types |= other.skipped_record_types
+
+  def show(self, xml_data):
+    # A stream only sees its root once reading starts, and drops children as it goes.
+    if xml_stream.XmlRecords.is_stream(xml_data):
+      print()
+      print("STREAM SUMMARY")
+      XmlDebug.show_node_summary(xml_stream.XmlRecords.get_root(xml_data), show_children = False)
+    else:
+      print()
+      print("TREE SUMMARY")
+      XmlDebug.show_node_summary(xml_stream.XmlRecords.get_root(xml_data))
+
     print()
     print("RECORD SUMMARY")
-    print(record_metrics)
-    if cls._show_missing_unit_records:
-      print("MISSING UNIT RECORD TYPES: {}".format(len(missing_unit_record_types)))
-      print(missing_unit_record_types)
-    if cls._show_skipped_records:
-      print("SKIPPED RECORD TYPES: {}".format(len(skipped_record_types)))
-      print(skipped_record_types)
-    if cls._show_orphaned_records:
+    print(self.record_metrics)
+    if XmlDebug._show_missing_unit_records:
+      print("MISSING UNIT RECORD TYPES: {}".format(len(self.missing_unit_record_types)))
+      print(self.missing_unit_record_types)
+    if XmlDebug._show_skipped_records:
+      print("SKIPPED RECORD TYPES: {}".format(len(self.skipped_record_types)))
+      print(self.skipped_record_types)
+    if XmlDebug._show_orphaned_records:
       print("ORPHAN DATE RECORDS")
-      for t in orphan_date_records:
+      for t in self.orphan_date_records:
         print(t)
-        if cls._show_orphaned_dates:
-          print(sorted(orphan_date_records[t]))
+        if XmlDebug._show_orphaned_dates:
+          print(sorted(self.orphan_date_records[t]))
     
-    if cls._show_record_unit_counts:
+    if XmlDebug._show_record_unit_counts:
       print()
       print("RECORD AND UNIT TYPES")
-      for i, tu in enumerate(sorted(type_unit_counts.keys())):
+      for i, tu in enumerate(sorted(self.type_unit_counts.keys())):
         print("{index:3d}\t{count:8d}\t{unit:>10}\t{type}" \
                   .format(index = i,
-                          count = type_unit_counts[tu],
+                          count = self.type_unit_counts[tu],
                           unit = tu[1],
                           type = tu[0]))
     
-    if cls._show_record_source_counts:
+    if XmlDebug._show_record_source_counts:
       print()
       print("RECORD AND SOURCE TYPES")
-      for i, ts in enumerate(sorted(type_source_counts.keys())):
+      for i, ts in enumerate(sorted(self.type_source_counts.keys())):
         print("{index:3d}\t{count:8d}\t{source:>10}\t{type}" \
                   .format(index = i,
-                          count = type_source_counts[ts],
+                          count = self.type_source_counts[ts],
                           source = ts[1],
                           type = ts[0]))
@@ -1,7 +1,60 @@
+from contextlib import nullcontext
+from datetime import date
 import numpy as np
+from time import perf_counter
 
 import params as par
-from . import timeutil
+from . import timeutil, valueutil, xml_stream
+
+class ParseStats:
+
+  def __init__(self):
+    self.malformed_values = {}
+    self.matched_records = {}
+    self.unmatched_records = {}
+    self.already_parsed_records = 0
+    self.prefiltered_records = 0
+
+  @classmethod
+  def add_count(cls, counts, key, count = 1):
+    if key not in counts:
+      counts[key] = 0
+    counts[key] += count
+
+  def add_malformed_value(self, r):
+    self.add_count(self.malformed_values, r)
+
+  def merge(self, other):
+    for r, count in other.malformed_values.items():
+      self.add_count(self.malformed_values, r, count)
+    for t, count in other.matched_records.items():
+      self.add_count(self.matched_records, t, count)
+    for t, count in other.unmatched_records.items():
+      self.add_count(self.unmatched_records, t, count)
+    self.already_parsed_records += other.already_parsed_records
+    self.prefiltered_records += other.prefiltered_records
+
+  def show(self):
+    print()
+    print("RECORD TYPES: {} matched, {} unmatched".format(sum(self.matched_records.values()),
+                                                        sum(self.unmatched_records.values())))
+    print("{:>10}\t{:>10}\t{}".format('matched', 'unmatched', 'type'))
+    for t in sorted(self.matched_records.keys() | self.unmatched_records.keys()):
+      print("{matched:10d}\t{unmatched:10d}\t{type}" \
+                .format(matched = self.matched_records.get(t, 0),
+                        unmatched = self.unmatched_records.get(t, 0),
+                        type = t))
+    if self.prefiltered_records:
+      print("PREFILTERED (skipped): {}".format(self.prefiltered_records))
+    if self.already_parsed_records:
+      print("ALREADY PARSED (skipped): {}".format(self.already_parsed_records))
+
+    if not self.malformed_values:
+      return
+    print()
+    print("MALFORMED VALUES (skipped): {}".format(sum(self.malformed_values.values())))
+    for r in sorted(self.malformed_values, key = lambda r: r.name):
+      print("\t{}:\t{}".format(r.name, self.malformed_values[r]))
 
 class XmlParse:
   _record_types = par.RecordParams.RECORD_TYPES
@@ -12,15 +65,24 @@ class XmlParse:
 
   _checkpoint_every_n_records = 1000000
 
+  @classmethod
+  def add_to_hour(cls, hours, hr, hour_sum, hour_count = 1):
+    # Each hour keeps a running [sum, count] of its values, instead of the values themselves.
+    if hr not in hours:
+      hours[hr] = [hour_sum, hour_count]
+    else:
+      hours[hr][0] += hour_sum
+      hours[hr][1] += hour_count
+
   @classmethod
   def aggregate_by_hour(cls, records_by_date, records_to_agg_type):
     for r in records_by_date:
       for d in records_by_date[r]:
-        for hr in records_by_date[r][d]:
+        for hr, (hour_sum, hour_count) in records_by_date[r][d].items():
           if records_to_agg_type[r] == par.AggregateType.SUM:
-            records_by_date[r][d][hr] = np.sum(records_by_date[r][d][hr])
+            records_by_date[r][d][hr] = np.sum(hour_sum)
           elif records_to_agg_type[r] in [par.AggregateType.AVERAGE, par.AggregateType.MEDIAN]:
-            records_by_date[r][d][hr] = np.average(records_by_date[r][d][hr])
+            records_by_date[r][d][hr] = np.float64(hour_sum) / hour_count
     return records_by_date
   
   @classmethod
@@ -37,44 +99,180 @@ class XmlParse:
     return records_by_date
 
   @classmethod
-  def parse_xml_data(cls, xml_tree, start_date, end_date,
-                      parse_timezone, show_checkpoints = False):
-    records_to_units = {rt.record: rt.unit for rt in cls._record_types}
+  def aggregate_xml_records(cls, records_by_date):
     records_to_agg_type = {rt.record: rt.aggregation for rt in cls._record_types}
 
+    cls.aggregate_by_hour(records_by_date, records_to_agg_type)
+    cls.aggregate_by_day(records_by_date, records_to_agg_type)
+
+    return records_by_date
+
+  @classmethod
+  def merge_xml_records(cls, all_records_by_date):
+    # Partial records must be in file order, so that dates and hours keep the order they would
+    #   have had if they were parsed serially.
     records_by_date = {rt.record: {} for rt in cls._record_types}
-    full_record_names = {r: cls._record_type_prefix + r.name for r in records_by_date}
+    for partial_records_by_date in all_records_by_date:
+      for r in partial_records_by_date:
+        for d in partial_records_by_date[r]:
+          if d not in records_by_date[r]:
+            records_by_date[r][d] = {}
+          for hr, (hour_sum, hour_count) in partial_records_by_date[r][d].items():
+            cls.add_to_hour(records_by_date[r][d], hr, hour_sum, hour_count)
     
-    skip_iphone_records_full_names = \
-        [cls._record_type_prefix + sir.name for sir in cls._skip_iphone_records]
-    for i, record in enumerate(xml_tree.getroot().findall('Record')):
-      if show_checkpoints and i % cls._checkpoint_every_n_records == 0:
-        print ("Processed: {}".format(i))
-      record_datetime = timeutil.DatetimeUtil.parse_xml_datetime(
-                            datetime_string_from_xml = record.attrib['endDate'],
-                            parse_timezone = parse_timezone)
-      if not timeutil.DatetimeUtil.check_datetime_range(record_datetime, start_date, end_date):
+    return records_by_date
+
+  @classmethod
+  def collect_xml_records(cls, xml_data, start_date, end_date,
+                          parse_timezone, parse_stats, show_checkpoints = False,
+                          record_watermarks = None, record_columns = None,
+                          tree_summary = None, parse_timer = None, parse_checkpoint = None,
+                          hour_spill = None):
+    records_by_date = {rt.record: {} for rt in cls._record_types}
+    first_record = 0
+    if parse_checkpoint:
+      # Continues from the records in the checkpoint, which is saved again as records are added.
+      #   xml_data must align chunks (see util.xml_stream.XmlStream).
+      records_by_date = parse_checkpoint.hourly_sums
+      first_record = parse_checkpoint.num_records
+      checkpoint_offset = None
+
+    # Full record type name -> unit -> record type
+    record_types_by_name = {}
+    for rt in cls._record_types:
+      full_record_name = cls._record_type_prefix + rt.record.name
+      if full_record_name not in record_types_by_name:
+        record_types_by_name[full_record_name] = {}
+      record_types_by_name[full_record_name][rt.unit] = rt.record
+    
+    skip_iphone_records = set(cls._skip_iphone_records)
+    start_ordinal = start_date.toordinal()
+    end_ordinal = end_date.toordinal()
+    start_string, end_string = timeutil.DatetimeUtil.get_xml_date_range(start_date, end_date,
+                                                                        parse_timezone)
+    dates_by_ordinal = {}
+    matched_records = parse_stats.matched_records
+    unmatched_records = parse_stats.unmatched_records
+    if parse_timer:
+      loop_start_time = perf_counter()
+      loop_phase_seconds = dict(parse_timer.phase_seconds)
+    i = first_record - 1
+    for i, attrib in enumerate(xml_stream.XmlRecords.iter_records(xml_data), first_record):
+      if i % cls._checkpoint_every_n_records == 0:
+        if show_checkpoints and parse_timer:
+          parse_timer.show_progress(i, xml_stream.XmlRecords.get_bytes_read(xml_data),
+                                    resumed_records = first_record)
+        elif show_checkpoints:
+          print ("Processed: {}".format(i))
+        if parse_checkpoint:
+          checkpoint_offset = xml_data.records_offset
+      # Saved at the first record of the next chunk, when all records before it are in a chunk
+      #   that ends at records_offset.
+      if parse_checkpoint and checkpoint_offset is not None \
+          and not xml_data.records_offset == checkpoint_offset:
+        with parse_timer.time_phase('write') if parse_timer else nullcontext():
+          parse_checkpoint.save_at(xml_data.records_offset, i, record_watermarks)
+        checkpoint_offset = None
+      if hour_spill and i % hour_spill.check_every_n_records == 0:
+        hour_spill.check(records_by_date)
+      # Phases of sampled records are timed as they are done.
+      sampled = parse_timer and parse_timer.is_sampled(i)
+
+      # The summary parses endDate for every record, so it is not parsed again below.
+      if tree_summary:
+        end_day_hour = tree_summary.add_record(attrib)
+
+      if sampled:
+        sample_time = perf_counter()
+      record_type = attrib['type']
+      record_units = record_types_by_name.get(record_type)
+      r = record_units.get(attrib['unit']) if record_units else None
+      if sampled:
+        parse_timer.add_sample('match', sample_time)
+      if r is None:
+        ParseStats.add_count(unmatched_records, record_type)
+        continue
+      ParseStats.add_count(matched_records, record_type)
+
+      if record_columns is not None:
+        record_columns.append_xml_record(r, attrib)
+
+      if record_watermarks:
+        end_epoch, _ = timeutil.DatetimeUtil.parse_xml_timestamp(attrib['endDate'])
+        creation_epoch, _ = timeutil.DatetimeUtil.parse_xml_timestamp(
+                                attrib.get('creationDate', attrib['endDate']))
+        if not record_watermarks.check_and_update(r, end_epoch, creation_epoch):
+          parse_stats.already_parsed_records += 1
+          continue
+
+      if tree_summary:
+        record_day_hour = end_day_hour
+      else:
+        # Most records out of range are dropped without parsing the timestamp.
+        if sampled:
+          sample_time = perf_counter()
+        if not timeutil.DatetimeUtil.check_xml_date_range(attrib['endDate'],
+                                                          start_string, end_string):
+          continue
+        record_day_hour = timeutil.DatetimeUtil.parse_xml_day_hour(
+                              datetime_string_from_xml = attrib['endDate'],
+                              parse_timezone = parse_timezone)
+        if sampled:
+          parse_timer.add_sample('datetime decode', sample_time)
+      if not record_day_hour:
+        continue
+      record_day, record_hour = record_day_hour
+      if not timeutil.DatetimeUtil.check_day_ordinal_range(record_day, start_ordinal, end_ordinal):
         continue
 
-      if record.attrib['type'] in skip_iphone_records_full_names \
-            and cls._iphone_source_text in record.attrib['sourceName']:
+      if r in skip_iphone_records and cls._iphone_source_text in attrib['sourceName']:
         continue
       
-      for r in records_by_date:
-        if record.attrib['type'] == full_record_names[r] \
-              and record.attrib['unit'] == records_to_units[r]:
-          record_date = record_datetime.date()
-          record_hour = record_datetime.hour
-          if record_date not in records_by_date[r]:
-            records_by_date[r][record_date] = {}
-          if record_hour not in records_by_date[r][record_date]:
-            records_by_date[r][record_date][record_hour] = []
-          
-          v = eval(record.attrib['value'])
-          records_by_date[r][record_date][record_hour].append(v)
-          break
-    
-    cls.aggregate_by_hour(records_by_date, records_to_agg_type)
-    cls.aggregate_by_day(records_by_date, records_to_agg_type)
+      if sampled:
+        sample_time = perf_counter()
+      v = valueutil.ValueDecoder.try_decode(attrib['value'])
+      if sampled:
+        sample_time = parse_timer.add_sample('value decode', sample_time)
+      if v is None:
+        parse_stats.add_malformed_value(r)
+        continue
+
+      if record_day not in dates_by_ordinal:
+        dates_by_ordinal[record_day] = date.fromordinal(record_day)
+      record_date = dates_by_ordinal[record_day]
+      if record_date not in records_by_date[r]:
+        records_by_date[r][record_date] = {}
+      cls.add_to_hour(records_by_date[r][record_date], record_hour, v)
+      if sampled:
+        parse_timer.add_sample('accumulate', sample_time)
     
+    parse_stats.prefiltered_records += xml_stream.XmlRecords.get_prefiltered_records(xml_data)
+    if parse_timer:
+      parse_timer.add_loop(perf_counter() - loop_start_time, i + 1 - first_record,
+                            xml_stream.XmlRecords.get_bytes_read(xml_data), loop_phase_seconds)
     return records_by_date
+
+  @classmethod
+  def collect_xml_shard(cls, in_xml, byte_range, start_date, end_date, parse_timezone,
+                        record_watermarks = None, record_columns = None,
+                        tree_summary = None, parse_timer = None):
+    xml_data = xml_stream.XmlStream(in_xml, byte_range = byte_range)
+    parse_stats = ParseStats()
+    records_by_date = cls.collect_xml_records(xml_data, start_date, end_date,
+                                              parse_timezone, parse_stats,
+                                              record_watermarks = record_watermarks,
+                                              record_columns = record_columns,
+                                              tree_summary = tree_summary,
+                                              parse_timer = parse_timer)
+    return records_by_date, parse_stats, record_watermarks, record_columns, tree_summary, \
+              parse_timer
+
+  @classmethod
+  def parse_xml_data(cls, xml_data, start_date, end_date,
+                      parse_timezone, show_checkpoints = False):
+    parse_stats = ParseStats()
+    records_by_date = cls.collect_xml_records(xml_data, start_date, end_date,
+                                              parse_timezone, parse_stats, show_checkpoints)
+    parse_stats.show()
+
+    return cls.aggregate_xml_records(records_by_date)
@@ -0,0 +1,57 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+class ChunkPipeline:
+
+  # Reads the XML file in one task, and parses it in another, so that reading (and decompressing
+  #   a zip file) overlaps with parsing. Chunks are passed through a bounded queue: the reader
+  #   waits while the queue is full.
+  def __init__(self, xml_stream, queue_size):
+    self.xml_stream = xml_stream
+    self.queue_size = queue_size
+
+  async def read_chunks(self, queue, executor):
+    # Errors are passed to the parser in the queue, and raised there.
+    loop = asyncio.get_running_loop()
+    try:
+      with self.xml_stream.open_file() as xml_file:
+        while chunk := await loop.run_in_executor(executor, xml_file.read,
+                                                  self.xml_stream._chunk_size):
+          await queue.put(chunk)
+    except Exception as e:
+      await queue.put(e)
+      return
+    await queue.put(None)
+
+  @classmethod
+  def iter_queue(cls, queue, loop):
+    # Runs in the parser thread, so queue items are fetched on the event loop.
+    while True:
+      item = asyncio.run_coroutine_threadsafe(queue.get(), loop).result()
+      if item is None:
+        return
+      if isinstance(item, Exception):
+        raise item
+      yield item
+
+  async def run_async(self, parse_records):
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize = self.queue_size)
+    self.xml_stream.file_chunks = self.iter_queue(queue, loop)
+
+    executor = ThreadPoolExecutor(max_workers = 2)
+    reader = asyncio.create_task(self.read_chunks(queue, executor))
+    try:
+      return await loop.run_in_executor(executor, parse_records)
+    finally:
+      # The only way out, whether the parse is done, failed or was interrupted. The reader may be
+      #   waiting on a full queue, and stops when cancelled. Not waiting for the parser thread,
+      #   which stops when its queue.get() is cancelled as the event loop shuts down.
+      reader.cancel()
+      await asyncio.gather(reader, return_exceptions = True)
+      executor.shutdown(wait = False)
+      self.xml_stream.file_chunks = None
+
+  def run(self, parse_records):
+    # Returns the result of parse_records, which must read records from xml_stream.
+    return asyncio.run(self.run_async(parse_records))
@@ -0,0 +1,103 @@
+import re
+
+import params as par
+
+class XmlPrefilter:
+
+  _record_type_prefix = 'HKQuantityTypeIdentifier'
+
+  # Top-level elements, other than records, that are dropped whole
+  _dropped_tags = [b'Correlation', b'Workout']
+
+  # Passes the XML through as is, except for top-level records not of RECORD_TYPES, and
+  #   Correlations and Workouts, which are cut out before the bytes reach the XML parser.
+  #   Each chunk is filtered by a single regex substitution, which drops whole runs of elements,
+  #   so that Python code only runs once for each run, not for each element.
+  def __init__(self):
+    # The common prefix is matched once, not once for each type.
+    record_types = re.escape(self._record_type_prefix.encode()) + rb'(?:' \
+                      + b'|'.join(re.escape(rt.record.name.encode()) \
+                                      for rt in sorted(par.RecordParams.RECORD_TYPES,
+                                                       key = lambda rt: rt.record.name)) + rb')'
+
+    # '<' cannot appear in attribute values, so a start tag ends at the last '>' before the next
+    #   '<', and is empty if that is '/>'.
+    dropped_type = rb'type="(?!(?:' + record_types + rb')")'
+    dropped_record = rb'<Record\s(?:' + dropped_type + rb'|(?!type=")[^<>]*?\s' + dropped_type \
+                        + rb')(?:[^<]*/>(?=\s*(?:<|\Z))' \
+                        + rb'|[^<]*>[^<]*(?:<(?!/?Record[\s/>])[^<]*)*</Record>)'
+    dropped_elements = [rb'<' + t + rb'[\s>](?:[^<]*/>(?=\s*(?:<|\Z))|(?s:.*?)</' + t + rb'>)' \
+                            for t in self._dropped_tags]
+    dropped_element = rb'(?:' + b'|'.join([dropped_record] + dropped_elements) + rb')'
+
+    # Records in Correlations are not counted as skipped.
+    self.correlation_pattern = re.compile(dropped_elements[0])
+    self.drop_pattern = re.compile(dropped_element + rb'(?:\s*' + dropped_element + rb')*')
+
+    self.skipped_records = 0
+
+  @classmethod
+  def find_last_element(cls, buf, tag, start, end):
+    # Skips longer tags, e.g. WorkoutEvent for Workout.
+    element_start = buf.rfind(b'<' + tag, start, end)
+    while not element_start == -1 and buf[element_start + len(tag) + 1] not in b' \t\r\n/>':
+      element_start = buf.rfind(b'<' + tag, start, element_start)
+    return element_start
+
+  @classmethod
+  def is_element_complete(cls, buf, tag, start, end):
+    start_tag_end = buf.find(b'>', start, end)
+    if start_tag_end == -1:
+      return False
+    return buf[start_tag_end - 1] == ord('/') \
+              or not buf.find(b'</' + tag + b'>', start, end) == -1
+
+  def get_filter_end(self, buf, start = 0):
+    # Bytes from the last element start on are kept for the next chunk, or from an earlier
+    #   element that may be dropped, and is not complete yet.
+    filter_end = buf.rfind(b'<', start)
+    if filter_end == -1:
+      return len(buf)
+    for tag in [b'Record'] + self._dropped_tags:
+      element_start = self.find_last_element(buf, tag, start, filter_end)
+      if not element_start == -1 \
+          and not self.is_element_complete(buf, tag, element_start, filter_end):
+        filter_end = element_start
+    return filter_end
+
+  def drop_elements(self, match):
+    # Called once for each run of elements that are dropped
+    dropped = match.group()
+    if b'<Correlation' in dropped:
+      dropped = self.correlation_pattern.sub(b'', dropped)
+    self.skipped_records += dropped.count(b'<Record')
+    return b''
+
+  def filter_elements(self, buf, start, end):
+    return self.drop_pattern.sub(self.drop_elements, memoryview(buf)[start : end])
+
+  def iter_chunks(self, chunks):
+    buf = b''
+    for chunk in chunks:
+      start = 0
+      if buf:
+        # Only the start of the chunk is copied, up to where the element kept from the previous
+        #   chunk ends.
+        seam_size = len(buf)
+        while True:
+          seam = buf + chunk[ : seam_size]
+          filter_end = self.get_filter_end(seam)
+          if filter_end >= len(buf) or seam_size >= len(chunk):
+            break
+          seam_size *= 2
+        yield self.filter_elements(seam, 0, filter_end)
+        if seam_size >= len(chunk):
+          buf = seam[filter_end : ]
+          continue
+        start = filter_end - len(buf)
+
+      filter_end = self.get_filter_end(chunk, start)
+      buf = chunk[filter_end : ]
+      yield self.filter_elements(chunk, start, filter_end)
+
+    yield self.filter_elements(buf, 0, len(buf))
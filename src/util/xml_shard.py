@@ -0,0 +1,66 @@
+import mmap
+
+class XmlShards:
+
+  _record_start = b'<Record '
+  _correlation_start = b'<Correlation '
+  _correlation_end = b'</Correlation>'
+  _root_end = b'</HealthData>'
+
+  @classmethod
+  def find_record_boundary(cls, buf, pos, lower):
+    # lower must be a known top-level boundary at or before pos.
+    #   Records nested in a Correlation are not top-level, so skip past their Correlation.
+    while True:
+      boundary = buf.find(cls._record_start, pos)
+      if boundary == -1:
+        return -1
+
+      correlation_start = buf.rfind(cls._correlation_start, lower, boundary)
+      if correlation_start == -1 \
+          or not buf.rfind(cls._correlation_end, correlation_start, boundary) == -1:
+        return boundary
+
+      correlation_end = buf.find(cls._correlation_end, boundary)
+      if correlation_end == -1:
+        return -1
+      pos = correlation_end
+
+  @classmethod
+  def find_last_record_boundary(cls, buf, lower):
+    # Same as find_record_boundary, for the last top-level record in buf.
+    end = len(buf)
+    while True:
+      boundary = buf.rfind(cls._record_start, lower, end)
+      if boundary == -1:
+        return -1
+
+      correlation_start = buf.rfind(cls._correlation_start, lower, boundary)
+      if correlation_start == -1 \
+          or not buf.rfind(cls._correlation_end, correlation_start, boundary) == -1:
+        return boundary
+      end = correlation_start
+
+  @classmethod
+  def get_shard_ranges(cls, in_xml, num_shards):
+    assert num_shards > 0
+
+    with open(in_xml, 'rb') as xml_file, \
+          mmap.mmap(xml_file.fileno(), 0, access = mmap.ACCESS_READ) as buf:
+      data_start = cls.find_record_boundary(buf, 0, 0)
+      data_end = buf.rfind(cls._root_end)
+      assert not data_end == -1
+      if data_start == -1:
+        return []
+
+      boundaries = [data_start]
+      for i in range(1, num_shards):
+        target = data_start + (data_end - data_start) * i // num_shards
+        boundary = cls.find_record_boundary(buf, max(target, boundaries[-1]), boundaries[-1])
+        if boundary == -1 or boundary >= data_end:
+          break
+        if boundary > boundaries[-1]:
+          boundaries.append(boundary)
+      boundaries.append(data_end)
+
+    return list(zip(boundaries[ : -1], boundaries[1 : ]))
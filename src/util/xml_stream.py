@@ -0,0 +1,220 @@
+from xml.etree import ElementTree as ET
+from xml.parsers import expat
+
+import params as par
+from . import dataio, xml_prefilter, xml_shard
+
+try:
+  from lxml import etree as lxml_etree
+except ImportError:
+  lxml_etree = None
+
+class XmlStream:
+
+  _record_tag = 'Record'
+  _chunk_size = 1 << 20
+  # Chunks are passed through unaligned once no top-level record starts within this many bytes,
+  #   e.g. in the Workouts and ActivitySummaries at the end of an export.
+  _max_aligned_chunk_size = 4 * _chunk_size
+
+  _shard_root_start = b'<HealthData>'
+  _shard_root_end = b'</HealthData>'
+
+  # in_xml may also be a zip file exported by Apple Health (see util.dataio.DataIO).
+  # If byte_range is set, only that slice of the file is read. It must start and end on top-level
+  #   element boundaries (see util.xml_shard.XmlShards), and is wrapped in a root element.
+  # If resume_offset is set, the file is read from there to the end. It must be a records_offset
+  #   of an earlier stream with align_chunks set (see util.parse_state.ParseCheckpoint).
+  def __init__(self, in_xml, byte_range = None, backend = None, prefilter_records = None,
+                align_chunks = False, resume_offset = None):
+    self.in_xml = in_xml
+    self.byte_range = byte_range
+    self.resume_offset = resume_offset
+    self.backend = backend or par.ParserParams.XML_BACKEND
+    if self.backend == par.XmlBackend.LXML:
+      assert lxml_etree, "lxml is not installed"
+
+    if prefilter_records is None:
+      prefilter_records = par.ParserParams.PREFILTER_RECORDS
+    self.prefilter = xml_prefilter.XmlPrefilter() if prefilter_records else None
+    # Chunks of the file read by another task, instead of read here (see util.xml_pipeline)
+    self.file_chunks = None
+    self.root = None
+    self.bytes_read = 0
+
+    # If chunks end on top-level record boundaries, all records yielded so far end at
+    #   records_offset in the file, as long as the next one has not been yielded yet.
+    self.align_chunks = align_chunks
+    self.records_offset = resume_offset or 0
+
+  def open_file(self):
+    xml_file = dataio.DataIO.open_raw_xml(self.in_xml)
+    if self.resume_offset:
+      xml_file.seek(self.resume_offset)
+    return xml_file
+
+  def iter_file_chunks(self):
+    with self.open_file() as xml_file:
+      while chunk := xml_file.read(self._chunk_size):
+        yield chunk
+
+  @classmethod
+  def iter_aligned_chunks(cls, chunks):
+    # Yields each chunk, and whether it ends just before a top-level record (or at the end).
+    #   Once a chunk cannot be aligned, the rest are not aligned either, since the start of the
+    #   next one may be nested in an element.
+    chunks = iter(chunks)
+    buf = bytearray()
+    for chunk in chunks:
+      buf += chunk
+      boundary = xml_shard.XmlShards.find_last_record_boundary(buf, 0)
+      if boundary > 0:
+        yield bytes(buf[ : boundary]), True
+        del buf[ : boundary]
+      elif len(buf) > cls._max_aligned_chunk_size:
+        yield bytes(buf), False
+        buf.clear()
+        break
+    if buf:
+      yield bytes(buf), True
+
+    for chunk in chunks:
+      yield chunk, False
+
+  def iter_chunks(self):
+    if not self.byte_range:
+      file_chunks = self.file_chunks if self.file_chunks is not None else self.iter_file_chunks()
+      if self.align_chunks:
+        file_chunks = self.iter_aligned_chunks(file_chunks)
+      else:
+        file_chunks = ((chunk, True) for chunk in file_chunks)
+      if self.resume_offset:
+        yield self._shard_root_start
+
+      chunks_end = self.records_offset
+      is_aligned_end = True
+      for chunk, is_aligned in file_chunks:
+        # The parser asks for the next chunk only once all records in earlier chunks are done.
+        #   records_offset stays where it is after a chunk that is not aligned.
+        if is_aligned_end:
+          self.records_offset = chunks_end
+        chunks_end += len(chunk)
+        is_aligned_end = is_aligned
+        self.bytes_read += len(chunk)
+        yield chunk
+      return
+
+    start, end = self.byte_range
+    yield self._shard_root_start
+    with open(self.in_xml, 'rb') as xml_file:
+      xml_file.seek(start)
+      remaining = end - start
+      while remaining > 0 and (chunk := xml_file.read(min(self._chunk_size, remaining))):
+        remaining -= len(chunk)
+        self.bytes_read += len(chunk)
+        yield chunk
+    yield self._shard_root_end
+
+  def iter_parser_chunks(self):
+    if self.prefilter:
+      return self.prefilter.iter_chunks(self.iter_chunks())
+    return self.iter_chunks()
+
+  def read_root(self):
+    # Only reads as far as the start of the root element.
+    parser = ET.XMLPullParser(events = ('start',))
+    for chunk in self.iter_chunks():
+      parser.feed(chunk)
+      for _, elem in parser.read_events():
+        self.root = elem
+        return self.root
+    return None
+
+  def iter_records(self):
+    # Yields the attributes of each top-level record, not records nested in a Correlation.
+    if self.backend == par.XmlBackend.EXPAT:
+      return self.iter_records_expat()
+    if self.backend == par.XmlBackend.LXML:
+      return self.iter_records_pull(lxml_etree.XMLPullParser)
+    return self.iter_records_pull(ET.XMLPullParser)
+
+  def iter_records_pull(self, pull_parser):
+    parser = pull_parser(events = ('start', 'end'))
+    depth = 0
+    for chunk in self.iter_parser_chunks():
+      parser.feed(chunk)
+      for event, elem in parser.read_events():
+        if event == 'start':
+          if depth == 0:
+            self.root = elem
+          depth += 1
+          continue
+
+        depth -= 1
+        if not depth == 1:
+          continue
+        if elem.tag == self._record_tag:
+          yield elem.attrib
+        # Drop every finished top-level element so memory stays flat.
+        del self.root[:]
+    parser.close()
+
+  def iter_records_expat(self):
+    # No elements are built, only attribute dicts of records.
+    records = []
+    depth = 0
+
+    def start_element(tag, attrib):
+      nonlocal depth
+      if depth == 0:
+        self.root = ET.Element(tag, attrib)
+      elif depth == 1 and tag == self._record_tag:
+        records.append(attrib)
+      depth += 1
+
+    def end_element(tag):
+      nonlocal depth
+      depth -= 1
+
+    parser = expat.ParserCreate()
+    parser.StartElementHandler = start_element
+    parser.EndElementHandler = end_element
+    for chunk in self.iter_parser_chunks():
+      parser.Parse(chunk, False)
+      yield from records
+      records.clear()
+    parser.Parse(b'', True)
+    yield from records
+
+
+class XmlRecords:
+
+  _record_tag = 'Record'
+
+  @classmethod
+  def is_stream(cls, xml_data):
+    return isinstance(xml_data, XmlStream)
+
+  @classmethod
+  def iter_records(cls, xml_data):
+    if cls.is_stream(xml_data):
+      return xml_data.iter_records()
+    return (r.attrib for r in xml_data.getroot().findall(cls._record_tag))
+
+  @classmethod
+  def get_bytes_read(cls, xml_data):
+    if cls.is_stream(xml_data):
+      return xml_data.bytes_read
+    return None
+
+  @classmethod
+  def get_prefiltered_records(cls, xml_data):
+    if cls.is_stream(xml_data) and xml_data.prefilter:
+      return xml_data.prefilter.skipped_records
+    return 0
+
+  @classmethod
+  def get_root(cls, xml_data):
+    if cls.is_stream(xml_data):
+      return xml_data.root if xml_data.root is not None else xml_data.read_root()
+    return xml_data.getroot()